@@ -0,0 +1,119 @@
+from typing import Callable, Any, List, NamedTuple
+import numpy as np
+
+from foldtree import Node
+
+ArrayTree = NamedTuple('ArrayTree', [('labels', np.ndarray),
+                                     ('offsets', np.ndarray),
+                                     ('children', np.ndarray),
+                                     ('levels', np.ndarray)])
+
+
+def index_array(lst: List[int], n: int) -> np.ndarray:
+    """Use 32-bit indices unless there are too many nodes"""
+    dtype = np.int32 if n < 2**31 else np.int64
+    return np.array(lst, dtype=dtype)
+
+
+def from_node(t: Node) -> ArrayTree:
+    """Convert a tree of Nodes to an ArrayTree"""
+    labels: List[Any] = []
+    offsets = [0]
+    children: List[int] = []
+    levels = [0]
+
+    level = [t]
+    while len(level) > 0:
+        next_level: List[Node] = []
+        for (label, subtrees) in level:
+            labels.append(label)
+            for subtree in subtrees:
+                # node ids of the next level continue from this level
+                children.append(levels[-1] + len(level) + len(next_level))
+                next_level.append(subtree)
+            offsets.append(len(children))
+        levels.append(levels[-1] + len(level))
+        level = next_level
+
+    n = len(labels)
+    return ArrayTree(np.array(labels), index_array(offsets, n),
+                     index_array(children, n), index_array(levels, n))
+
+
+def to_node(t: ArrayTree) -> Node:
+    """Convert an ArrayTree to a tree of Nodes"""
+    labels = t.labels.tolist()
+    offsets = t.offsets.tolist()
+    children = t.children.tolist()
+
+    nodes: List[Any] = [None] * len(labels)
+    # children always come after their parent, so build the nodes backward
+    for i in range(len(labels) - 1, -1, -1):
+        subtrees = [nodes[c] for c in children[offsets[i]:offsets[i + 1]]]
+        nodes[i] = Node(labels[i], subtrees)
+    return nodes[0]
+
+
+def foldtree_array(f: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                   g: np.ufunc, a: Any, t: ArrayTree) -> Any:
+    """Apply f and g to an ArrayTree, one level at a time.
+    f: fold an array of labels to an array of folded subtrees
+    g: a ufunc that folds subtrees
+    a: an initial constant
+    t: an ArrayTree
+    """
+    (labels, offsets, children, levels) = t
+    # the folded subtrees of all nodes. Its dtype is set by the deepest level
+    folded = np.empty(0)
+
+    for k in range(len(levels) - 2, -1, -1):
+        (lo, hi) = (levels[k], levels[k + 1])
+        starts = offsets[lo:hi]
+        nonempty = offsets[lo + 1:hi + 1] > starts
+
+        reduced = np.full(hi - lo, a)
+        if nonempty.any():
+            vals = folded[children[offsets[lo]:offsets[hi]]]
+            reduced = reduced.astype(np.result_type(reduced, vals))
+            reduced[nonempty] = g(
+                g.reduceat(vals, starts[nonempty] - offsets[lo]), a)
+
+        level_folded = f(labels[lo:hi], reduced)
+        if k == len(levels) - 2:
+            folded = np.empty(len(labels), dtype=level_folded.dtype)
+        elif folded.dtype != np.result_type(folded, level_folded):
+            folded = folded.astype(np.result_type(folded, level_folded))
+        folded[lo:hi] = level_folded
+
+    return folded[0]
+
+
+def sumtree(t: ArrayTree) -> Any:
+    """Sum all labels in a tree."""
+    return foldtree_array(np.add, np.add, 0, t)
+
+
+def tree_size(t: ArrayTree) -> int:
+    """Return the number of nodes in a tree"""
+
+    def f(labels: np.ndarray, folded_subtrees: np.ndarray) -> np.ndarray:
+        return 1 + folded_subtrees
+
+    return int(foldtree_array(f, np.add, 0, t))
+
+
+def tree_depth(t: ArrayTree) -> int:
+    """Returns the maximal depth of nodes in the tree"""
+
+    def f(labels: np.ndarray, folded_subtrees: np.ndarray) -> np.ndarray:
+        return 1 + folded_subtrees
+
+    return int(foldtree_array(f, np.maximum, 0, t))
+
+
+def maptree(func: Callable[[np.ndarray], np.ndarray],
+            t: ArrayTree) -> ArrayTree:
+    """Map a vectorized function to all labels in a tree.
+    Return a new tree.
+    """
+    return t._replace(labels=np.asarray(func(t.labels)))
@@ -0,0 +1,309 @@
+from typing import Callable, Any, List, Dict, Optional, Sequence, Tuple
+from itertools import islice
+from math import cos, isqrt, sin, pi
+import argparse
+import decimal
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+import numpy as np
+
+from game import SearchStats
+import array_tree
+import diff
+import foldtree
+import integrate
+import lazy_utils
+import newton
+import tic_tac_toe
+
+# a run is a regression if it's slower than the baseline by this fraction
+threshold = 0.25
+
+
+def timed(func: Callable[[], Any], repeat: int = 3) -> float:
+    """Return the best time (in seconds) of one call to func"""
+    timer = timeit.Timer(func)
+    (number, _) = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+class Counted:
+    """A function that counts how many times it's called"""
+
+    def __init__(self, f: Callable[[float], float]):
+        self.f = f
+        self.calls = 0
+
+    def __call__(self, x: float) -> float:
+        self.calls = self.calls + 1
+        return self.f(x)
+
+
+def complete_tree(size: int, branching: int = 4) -> foldtree.Node:
+    """A tree of size nodes, numbered breadth-first"""
+    nodes = [foldtree.Node(i, []) for i in range(size)]
+    for i in range(1, size):
+        nodes[(i - 1) // branching].subtrees.append(nodes[i])
+    return nodes[0]
+
+
+def lazy_tree(t: foldtree.Node) -> lazy_utils.Node:
+    """Convert a tree with lists of subtrees to a lazy tree"""
+    (label, subtrees) = t
+    if len(subtrees) == 0:
+        return lazy_utils.Node(label, None)
+    else:
+        return lazy_utils.Node(label, map(lazy_tree, subtrees))
+
+
+def bench_folds(sizes: Sequence[int] = (100, 1000,
+                                        10000)) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for n in sizes:
+        t = complete_tree(n)
+        arr = array_tree.from_node(t)
+        benches = [('foldtree', lambda: foldtree.sumtree(t)),
+                   ('foldtree_index',
+                    lambda: foldtree.sumtree(t, foldtree.foldtree_index)),
+                   ('lazy_foldtree', lambda: lazy_utils.sumtree(lazy_tree(t))),
+                   ('lazy_foldtree_stack', lambda: lazy_utils.sumtree(
+                       lazy_tree(t), lazy_utils.foldtree_stack)),
+                   ('foldtree_array', lambda: array_tree.sumtree(arr))]
+        for (name, func) in benches:
+            assert func() == n * (n - 1) // 2
+            results['fold/%s/%d' % (name, n)] = {
+                'time': timed(func),
+                'nodes': n
+            }
+    return results
+
+
+def bench_numerical() -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    for (name, sqrt) in [('newton_sqrt', newton.newton_sqrt),
+                         ('newton_sqrt_relative', newton.newton_sqrt_relative)
+                         ]:
+        results['sqrt/' + name] = {'time': timed(lambda: sqrt(2.0, 1.0))}
+
+    ns = np.linspace(0.5, 1000.0, 100000)
+    for (name, sqrt_array) in [('newton_sqrt_array', newton.newton_sqrt_array),
+                               ('newton_sqrt_relative_array',
+                                newton.newton_sqrt_relative_array)]:
+        (_, iterations) = sqrt_array(ns, 1.0)
+        results['sqrt/%s/%d' % (name, ns.size)] = {
+            'time': timed(lambda: sqrt_array(ns, 1.0)),
+            'evaluations': int(iterations.sum())
+        }
+
+    n = random.Random(0).getrandbits(100000)
+    results['sqrt/newton_isqrt/%d' % n.bit_length()] = {
+        'time': timed(lambda: newton.newton_isqrt(n))
+    }
+    results['sqrt/math_isqrt/%d' % n.bit_length()] = {
+        'time': timed(lambda: isqrt(n))
+    }
+    with decimal.localcontext() as ctx:
+        ctx.prec = 5000
+        results['sqrt/newton_sqrt_decimal/5000'] = {
+            'time':
+            timed(lambda: newton.newton_sqrt_decimal(decimal.Decimal(2)))
+        }
+        results['sqrt/decimal_sqrt/5000'] = {
+            'time': timed(lambda: decimal.Decimal(2).sqrt())
+        }
+
+    for (name, d) in [('diff1', diff.diff1), ('diff2', diff.diff2),
+                      ('diff3', diff.diff3)]:
+        f = Counted(sin)
+        d(1.0, f, 0.3)
+        results['diff/' + name] = {
+            'time': timed(lambda: d(1.0, sin, 0.3)),
+            'evaluations': f.calls
+        }
+    for (name, transform) in [('super_improve', diff.super_improve),
+                              ('richardson', diff.richardson)]:
+        results['diff/%s/8' % name] = {
+            'time':
+            timed(lambda: list(
+                islice(transform(diff.differentiate(1.0, sin, 0.3)), 8)))
+        }
+
+    x = np.linspace(0.0, 0.5, 10000)
+    for (name, d_batch) in [('diff1_batch', diff.diff1_batch),
+                            ('diff2_batch', diff.diff2_batch),
+                            ('diff3_batch', diff.diff3_batch)]:
+        results['diff/%s/%d' % (name, x.size)] = {
+            'time': timed(lambda: d_batch(1.0, np.sin, x))
+        }
+
+    for (name, integ) in [('integrate1', integrate.integrate1),
+                          ('integrate2', integrate.integrate2),
+                          ('integrate3', integrate.integrate3),
+                          ('integrate4', integrate.integrate4)]:
+        f = Counted(sin)
+        integ(f, 0.0, pi)
+        results['integrate/' + name] = {
+            'time': timed(lambda: integ(sin, 0.0, pi)),
+            'evaluations': f.calls
+        }
+
+    for (name,
+         integ_array) in [('integrate2_array', integrate.integrate2_array),
+                          ('integrate3_array', integrate.integrate3_array),
+                          ('integrate4_array', integrate.integrate4_array)]:
+        results['integrate/' + name] = {
+            'time': timed(lambda: integ_array(np.sin, 0.0, pi))
+        }
+
+    q = integrate.integrate_adaptive(sin, 0.0, pi)
+    results['integrate/integrate_adaptive'] = {
+        'time': timed(lambda: integrate.integrate_adaptive(sin, 0.0, pi)),
+        'evaluations': q.evaluations
+    }
+
+    def g(x: float) -> float:
+        return cos(x) - x
+
+    options: List[Tuple[str, Dict[str, Any]]] = [('analytic', {
+        'df': lambda x: -sin(x) - 1.0
+    }), ('diff2', {}), ('diff2_reuse3', {
+        'reuse': 3
+    }), ('diff3', {
+        'derivative': diff.diff3
+    }), ('diff3_reuse3', {
+        'derivative': diff.diff3,
+        'reuse': 3
+    })]
+    for (name, kwargs) in options:
+        root = newton.find_root(g, 1.0, esp=1e-12, **kwargs)
+        results['root/find_root/' + name] = {
+            'time':
+            timed(lambda: newton.find_root(g, 1.0, esp=1e-12, **kwargs)),
+            'evaluations': root.evaluations
+        }
+
+    for (name, accelerate) in [('none', lambda itr: itr),
+                               ('aitken', lazy_utils.aitken),
+                               ('wynn', lazy_utils.wynn),
+                               ('levin', lazy_utils.levin)]:
+        f = Counted(cos)
+        next(lazy_utils.within(1e-10, accelerate(lazy_utils.repeat_f(f, 1.0))))
+        results['accelerate/' + name] = {
+            'time':
+            timed(lambda: next(
+                lazy_utils.within(1e-10,
+                                  accelerate(lazy_utils.repeat_f(cos, 1.0))))),
+            'evaluations':
+            f.calls
+        }
+
+    return results
+
+
+def bench_search(board: Optional[List] = None) -> Dict[str, Dict[str, float]]:
+    if board is None:
+        board = [1, 0, None, None, 0, None, None, None, None]
+    evaluators: List[Tuple[str,
+                           Callable]] = [('evaluate0', tic_tac_toe.evaluate0),
+                                         ('evaluate1', tic_tac_toe.evaluate1),
+                                         ('evaluate2', tic_tac_toe.evaluate2)]
+    results = {}
+    max_depth = tic_tac_toe.max_depth
+    player = tic_tac_toe.who_plays(board)
+    try:
+        for depth in range(1, max_depth + 1):
+            tic_tac_toe.max_depth = depth
+            for (name, evaluate) in evaluators:
+                stats = SearchStats()
+                evaluate(player, stats=stats)(board)
+                report = stats.reports[-1]
+                evaluate_ = evaluate(player)
+                results['search/%s/%d' % (name, depth)] = {
+                    'time': timed(lambda: evaluate_(board)),
+                    'nodes': report.visited,
+                    'evaluations': report.evaluations
+                }
+    finally:
+        tic_tac_toe.max_depth = max_depth
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            threshold: float = threshold) -> List[str]:
+    """Return the descriptions of regressions"""
+    regressions = []
+    for name in sorted(results.keys() & baseline.keys()):
+        (new, old) = (results[name], baseline[name])
+        if new['time'] > old['time'] * (1 + threshold):
+            regressions.append('%s: %.3g s (baseline %.3g s)' %
+                               (name, new['time'], old['time']))
+        for count in ['nodes', 'evaluations']:
+            if count in new and count in old and new[count] > old[count]:
+                regressions.append('%s: %d %s (baseline %d)' %
+                                   (name, new[count], count, old[count]))
+    return regressions
+
+
+def run(select: str = '') -> Dict[str, Dict[str, float]]:
+    """Run the benchmarks whose names start with select"""
+    results = {}
+    groups = [(['fold/'], bench_folds),
+              (['sqrt/', 'diff/', 'integrate/', 'root/',
+                'accelerate/'], bench_numerical), (['search/'], bench_search)]
+    for (prefixes, bench) in groups:
+        # skip a group if none of its benchmarks can be selected
+        if any(p.startswith(select) or select.startswith(p) for p in prefixes):
+            results.update(bench())
+    return {
+        name: r
+        for (name, r) in results.items() if name.startswith(select)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the algorithms')
+    parser.add_argument('--output', help='save the results to a JSON file')
+    parser.add_argument('--baseline',
+                        help='compare the results with a JSON file')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=threshold,
+                        help='allowed slowdown (fraction)')
+    parser.add_argument(
+        '--select',
+        default='',
+        help='only run the benchmarks that start with this prefix')
+    args = parser.parse_args(argv)
+
+    results = run(args.select)
+    for (name, r) in results.items():
+        counts = ' '.join('%s=%d' % (k, v) for (k, v) in r.items()
+                          if k != 'time')
+        print('%-36s %12.6f ms  %s' % (name, r['time'] * 1000, counts))
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)),
+                    exist_ok=True)
+        report = {'python': platform.python_version(), 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,15 @@
-from math import log2
-from typing import Callable, Iterator
-from itertools import tee
-from lazy_utils import repeat_f, within, repeat_itr
+from math import log2, nan
+from typing import Callable, Iterator, Iterable, List, Optional, Any
+from typing import Union, TypeVar
+from itertools import chain, islice
+import numpy as np
+from lazy_utils import repeat_f, within, repeat_itr, within_limited, Estimate
 
 esp = 0.000000001  # a small number that's used to call within()
 
+# an approximation, or an array of them in the batch versions
+V = TypeVar('V', float, np.ndarray)
+
 
 def easydiff(f: Callable[[float], float],
              x: float) -> Callable[[float], float]:
@@ -32,12 +37,12 @@ def diff1(h0: float, f: Callable[[float], float], x: float) -> float:
     return next(d)
 
 
-def elimerror(n: int, itr: Iterator[float]) -> Iterator[float]:
+def elimerror(n: Union[int, np.ndarray], itr: Iterator[V]) -> Iterator[V]:
     """Reduce the error of sequence approx. derivative, assuming order n."""
     a = next(itr)
     while True:
         b = next(itr)
-        p = 2.0**n
+        p: Any = 2.0**n
         c = (b * p - a) / (p - 1.0)
         yield c
         a = b
@@ -51,9 +56,9 @@ def order(itr: Iterator[float]) -> int:
 
 def improve(itr: Iterator[float]) -> Iterator[float]:
     """Improve the congergence of sequence approx. derivative."""
-    (itr1, itr2) = tee(itr)
-    n: int = order(itr1)
-    return elimerror(n, itr2)
+    first = list(islice(itr, 3))
+    n: int = order(iter(first))
+    return elimerror(n, chain(first, itr))
 
 
 def diff2(h0: float, f: Callable[[float], float], x: float) -> float:
@@ -75,5 +80,167 @@ def super_improve(itr: Iterator[float]) -> Iterator[float]:
 
 def diff3(h0: float, f: Callable[[float], float], x: float) -> float:
     """Approximate f'(x), with an initial h0."""
-    d = within(esp, super_improve(differentiate(h0, f, x)))
+    d = within(esp, richardson(differentiate(h0, f, x)))
     return next(d)
+
+
+def extrapolate(a: Any, b: Any, p: Any) -> Any:
+    """(b * p - a) / (p - 1.0), or b if p == 1.0 (the order is 0)."""
+    if isinstance(p, np.ndarray):
+        # the points whose order couldn't be estimated are kept
+        keep = (p == 1.0) | (p == 0.0) | ~np.isfinite(p)
+        return np.where(keep, b, (b * p - a) / (p - 1.0))
+    return b if p == 1.0 else (b * p - a) / (p - 1.0)
+
+
+def richardson(itr: Iterator[V],
+               order_: Callable[[Iterator], Any] = order,
+               orders: Optional[Iterable[Any]] = None) -> Iterator[V]:
+    """Same as super_improve(itr), with bounded memory.
+    If orders are given, they are used instead of estimating the orders.
+    """
+    orders_ = None if orders is None else iter(orders)
+    firsts: List[List[V]] = []  # the first 3 values of each row
+    powers: List[Any] = []  # the power of 2 for each row
+    lasts: List[V] = []  # the last value of each row
+
+    for v in itr:
+        # push the new value down the rows. A row gets 2 new values
+        # when the order of the row above it is estimated.
+        (j, values) = (0, [v])
+        while len(values) > 0:
+            if j == len(firsts):
+                firsts.append([])
+                powers.append(None)
+                lasts.append(v)
+
+            (fs, next_values) = (firsts[j], [])
+            for b in values:
+                if len(fs) < 3:
+                    fs.append(b)
+                    if len(fs) == 2:
+                        yield b
+                    elif len(fs) == 3:
+                        try:
+                            n = order_(
+                                iter(fs)) if orders_ is None else next(orders_)
+                            p = powers[j] = 2.0**n
+                        except (ValueError, ZeroDivisionError, OverflowError):
+                            p = powers[j] = 1.0
+                        next_values = [
+                            extrapolate(fs[0], fs[1], p),
+                            extrapolate(fs[1], fs[2], p)
+                        ]
+                else:
+                    next_values.append(extrapolate(lasts[j], b, powers[j]))
+                lasts[j] = b
+            (j, values) = (j + 1, next_values)
+
+
+def easydiff_batch(f: Callable[[np.ndarray], np.ndarray], x: np.ndarray,
+                   active: np.ndarray) -> Callable[[float], np.ndarray]:
+    fx = f(x)
+
+    def easydiff_(h: float) -> np.ndarray:
+        d = np.full(x.shape, nan)
+        d[active] = (f(x[active] + h) - fx[active]) / h
+        return d
+
+    return easydiff_
+
+
+def differentiate_batch(h0: float, f: Callable[[np.ndarray],
+                                               np.ndarray], x: np.ndarray,
+                        active: np.ndarray) -> Iterator[np.ndarray]:
+    """Like differentiate, for the active points in x"""
+    return map(easydiff_batch(f, x, active), repeat_f(half, h0))
+
+
+def within_batch(esp: float, itr: Iterator[np.ndarray],
+                 active: np.ndarray) -> np.ndarray:
+    """Like next(within(esp, itr)), for each active point.
+    Points are removed from active as they converge.
+    """
+    result = np.full(active.shape, nan)
+    # the points that fail are nan or infinite. The iterators are lazy,
+    # so the warnings have to be turned off while they are consumed.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = next(itr)
+        while active.any():
+            b = next(itr)
+            done = active & (np.abs(a - b) <= esp)
+            result[done] = b[done]
+            # a point that became nan will never converge. Its result is nan.
+            done |= active & np.isnan(b)
+            # update the mask in place, because it's shared with the source
+            active &= ~done
+            a = b
+    return result
+
+
+def order_batch(itr: Iterator[np.ndarray]) -> np.ndarray:
+    """Estimate the order for elimerror(), for each point."""
+    a, b, c = next(itr), next(itr), next(itr)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round(np.log2((a - c) / (b - c) - 1.0))
+
+
+def improve_batch(itr: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """Like improve, for each point."""
+    first = list(islice(itr, 3))
+    n = order_batch(iter(first))
+    return elimerror(n, chain(first, itr))
+
+
+def super_improve_batch(itr: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """Like super_improve, for each point."""
+    return richardson(itr, order_batch)
+
+
+def diff_batch(
+    h0: float, f: Callable[[np.ndarray], np.ndarray], x: np.ndarray,
+    transform: Callable[[Iterator[np.ndarray]], Iterator[np.ndarray]]
+) -> np.ndarray:
+    """Approximate f'(x) at each point of x.
+    The approximations are improved with transform.
+    """
+    x = np.asarray(x, dtype=float)
+    active = np.ones(x.shape, dtype=bool)
+    return within_batch(esp, transform(differentiate_batch(h0, f, x, active)),
+                        active)
+
+
+def diff1_batch(h0: float, f: Callable[[np.ndarray], np.ndarray],
+                x: np.ndarray) -> np.ndarray:
+    """Like diff1, for each point of x. f must be vectorized."""
+    return diff_batch(h0, f, x, lambda d: d)
+
+
+def diff2_batch(h0: float, f: Callable[[np.ndarray], np.ndarray],
+                x: np.ndarray) -> np.ndarray:
+    """Like diff2, for each point of x. f must be vectorized."""
+    return diff_batch(h0, f, x, improve_batch)
+
+
+def diff3_batch(h0: float, f: Callable[[np.ndarray], np.ndarray],
+                x: np.ndarray) -> np.ndarray:
+    """Like diff3, for each point of x. f must be vectorized."""
+    return diff_batch(h0, f, x, super_improve_batch)
+
+
+def diff1_limited(h0: float, f: Callable[[float], float], x: float,
+                  **limits: Any) -> Estimate:
+    """Like diff1, but give up if a limit is reached."""
+    return within_limited(esp, differentiate(h0, f, x), **limits)
+
+
+def diff2_limited(h0: float, f: Callable[[float], float], x: float,
+                  **limits: Any) -> Estimate:
+    """Like diff2, but give up if a limit is reached."""
+    return within_limited(esp, improve(differentiate(h0, f, x)), **limits)
+
+
+def diff3_limited(h0: float, f: Callable[[float], float], x: float,
+                  **limits: Any) -> Estimate:
+    """Like diff3, but give up if a limit is reached."""
+    return within_limited(esp, richardson(differentiate(h0, f, x)), **limits)
@@ -23,40 +23,45 @@ def foldtree(f: Callable, g: Callable, a: Any, t: Union[Node, List]) -> Any:
         return g(foldtree(f, g, a, subtree), foldtree(f, g, a, rest))
 
 
-def sumtree(t: Node) -> int:
+def sumtree(t: Node, fold: Callable = foldtree) -> int:
     """Sum all labels in a tree."""
     f = operator.add
     g = operator.add
-    return foldtree(f, g, 0, t)
+    return fold(f, g, 0, t)
 
 
-def tree_labels(t: Node):
+def tree_labels(t: Node, fold: Callable = foldtree):
     """Collect all labels of a tree into a list."""
 
     def f(label: Any, folded_subtrees: List) -> List:
-        return [label] + folded_subtrees
+        labels = [label]
+        labels.extend(folded_subtrees)
+        return labels
 
     def g(folded_first: List, folded_rest: List) -> List:
-        return folded_first + folded_rest
+        # folded_first is a new list made by f, so it's safe to extend it
+        folded_first.extend(folded_rest)
+        return folded_first
 
-    return foldtree(f, g, [], t)
+    return fold(f, g, [], t)
 
 
-def maptree(func: Callable, t: Node) -> Node:
+def maptree(func: Callable, t: Node, fold: Callable = foldtree) -> Node:
     """Map a function to all labels in a tree.
     Return a new tree.
     """
 
-    def f(label: Any, folded_subtrees: List) -> Node:
-        return Node(func(label), folded_subtrees)
+    def f(label: Any, folded_subtrees: List) -> List[Node]:
+        return [Node(func(label), folded_subtrees)]
 
-    def g(folded_first: Node, folded_rest: List) -> List:
-        return [folded_first] + folded_rest
+    def g(folded_first: List[Node], folded_rest: List[Node]) -> List[Node]:
+        folded_first.extend(folded_rest)
+        return folded_first
 
-    return foldtree(f, g, [], t)
+    return fold(f, g, [], t)[0]
 
 
-def tree_size(t: Node) -> int:
+def tree_size(t: Node, fold: Callable = foldtree) -> int:
     """Return the number of nodes in a tree"""
 
     def f(label: int, folded_subtrees: int) -> int:
@@ -65,10 +70,10 @@ def tree_size(t: Node) -> int:
     def g(folded_first: int, folded_rest: int) -> int:
         return folded_first + folded_rest
 
-    return foldtree(f, g, 0, t)
+    return fold(f, g, 0, t)
 
 
-def tree_depth(t: Node) -> int:
+def tree_depth(t: Node, fold: Callable = foldtree) -> int:
     """Returns the maximal depth of nodes in the tree"""
 
     def f(label: Any, folded_subtrees: int) -> int:
@@ -77,4 +82,21 @@ def tree_depth(t: Node) -> int:
     def g(folded_first: int, folded_rest: int) -> int:
         return max(folded_first, folded_rest)
 
-    return foldtree(f, g, 0, t)
+    return fold(f, g, 0, t)
+
+
+def foldtree_index(f: Callable, g: Callable, a: Any, t: Union[Node,
+                                                              List]) -> Any:
+    """Like foldtree, but fold a list of subtrees from left to right by index.
+    g must be associative, and a must be an identity element for g.
+    """
+    if isinstance(t, Node):
+        (label, subtrees) = t
+        return f(label, foldtree_index(f, g, a, subtrees))
+    elif len(t) == 0:
+        return a
+    else:
+        acc = foldtree_index(f, g, a, t[0])
+        for i in range(1, len(t)):
+            acc = g(acc, foldtree_index(f, g, a, t[i]))
+        return acc
@@ -1,12 +1,152 @@
 from typing import Callable, List, Iterator, Optional, Union
+from typing import NamedTuple, Hashable, Tuple, Any
 from dataclasses import dataclass
+from collections import OrderedDict
+from math import inf, nextafter
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import operator
+import time
 
-from lazy_utils import reptree, maptree, Node
+from lazy_utils import reptree, maptree, maptree_batched, Node
 
 # Board is a type alias for representing a board configuration.
-# In this example,  it's just a list
-Board = List
+# In this example,  it's just a list, but it can be any type
+# (e.g., a bitboard)
+Board = Any
+
+
+def score_tree(static_eval_: Callable[[Board], Any],
+               static_eval_batch: Optional[Callable[[List[Board]], List]],
+               tree: Node) -> Node:
+    """Apply static_eval_ to the boards in a tree.
+    If static_eval_batch is given, apply it to the boards in batches instead.
+    """
+    if static_eval_batch is None:
+        return maptree(static_eval_, tree)
+    else:
+        return maptree_batched(static_eval_batch, tree)
+
+
+SearchReport = NamedTuple('SearchReport', [('nodes', List[int]),
+                                           ('visited', int), ('leaves', int),
+                                           ('evaluations', int),
+                                           ('cutoffs', int),
+                                           ('branching', float),
+                                           ('time_moves', float),
+                                           ('time_eval', float),
+                                           ('time_search', float)])
+
+
+class SearchStats:
+    """Statistics of searches.
+    A SearchReport is added to reports after each search.
+    """
+
+    def __init__(self):
+        self.reports: List[SearchReport] = []
+        self.start()
+
+    def start(self) -> None:
+        """Reset the counters for a new search"""
+        self.expanded: List[int] = []
+        self.visited = 0
+        self.leaves = 0
+        self.evaluations = 0
+        self.exhausted = 0
+        self.time_moves = 0.0
+        self.time_eval = 0.0
+        self.start_time = time.perf_counter()
+
+    def finish(self, result: Any) -> Any:
+        """Add the report of a search, and return its result"""
+        total = time.perf_counter() - self.start_time
+        expanded = sum(self.expanded)
+        # the average number of children of an expanded node
+        branching = (self.visited - 1) / expanded if expanded > 0 else 0.0
+        self.reports.append(
+            SearchReport(nodes=self.expanded,
+                         visited=self.visited,
+                         leaves=self.leaves,
+                         evaluations=self.evaluations,
+                         cutoffs=expanded - self.exhausted,
+                         branching=branching,
+                         time_moves=self.time_moves,
+                         time_eval=self.time_eval,
+                         time_search=total - self.time_moves - self.time_eval))
+        return result
+
+    def static_eval(
+            self, static_eval_: Callable[[Board],
+                                         Any]) -> Callable[[Board], Any]:
+        """Count and time static_eval_"""
+
+        def static_eval__(board: Board) -> Any:
+            t = time.perf_counter()
+            score = static_eval_(board)
+            self.time_eval = self.time_eval + time.perf_counter() - t
+            self.evaluations = self.evaluations + 1
+            return score
+
+        return static_eval__
+
+    def static_eval_batch(
+        self, static_eval_batch: Optional[Callable[[List[Board]], List]]
+    ) -> Optional[Callable[[List[Board]], List]]:
+        """Count and time static_eval_batch"""
+        if static_eval_batch is None:
+            return None
+
+        def static_eval_batch_(boards: List[Board]) -> List:
+            t = time.perf_counter()
+            scores = static_eval_batch(boards)
+            self.time_eval = self.time_eval + time.perf_counter() - t
+            self.evaluations = self.evaluations + len(boards)
+            return scores
+
+        return static_eval_batch_
+
+    def score_tree(self, static_eval_: Callable[[Board], Any],
+                   static_eval_batch: Optional[Callable[[List[Board]], List]],
+                   tree: Node) -> Node:
+        """Like score_tree, but count the scored tree as it's searched"""
+        # score_tree builds the whole tree, so the time that is not spent
+        # in static evaluation is spent in move generation
+        (t, time_eval) = (time.perf_counter(), self.time_eval)
+        scored = score_tree(self.static_eval(static_eval_),
+                            self.static_eval_batch(static_eval_batch), tree)
+        self.time_moves = self.time_moves + time.perf_counter() - t - (
+            self.time_eval - time_eval)
+        return self.tree(scored)
+
+    def tree(self, node: Node, ply: int = 0) -> Node:
+        """Count the nodes of a tree as they are visited"""
+        self.visited = self.visited + 1
+        (label, subtrees) = node
+
+        if subtrees is None:
+            self.leaves = self.leaves + 1
+            return Node(label, None)
+        else:
+            return Node(label, self.subtrees(subtrees, ply))
+
+    def subtrees(self, subtrees: Iterator[Node], ply: int) -> Iterator[Node]:
+        # this runs when the search asks for the first subtree
+        while len(self.expanded) <= ply:
+            self.expanded.append(0)
+        self.expanded[ply] = self.expanded[ply] + 1
+
+        while True:
+            t = time.perf_counter()
+            subtree = next(subtrees, None)
+            self.time_moves = self.time_moves + time.perf_counter() - t
+            if subtree is None:
+                break
+            yield self.tree(subtree, ply + 1)
+
+        # all subtrees were searched
+        self.exhausted = self.exhausted + 1
 
 
 def gametree(
@@ -44,13 +184,25 @@ def minimize0(node: Node) -> int:
     return s
 
 
-def evaluate0(gametree_: Callable[[Board],
-                                  Node], static_eval_: Callable[[Board], int],
-              prune_: Callable[[Node], Node]) -> Callable[[Board], int]:
+def evaluate0(gametree_: Callable[[Board], Node],
+              static_eval_: Callable[[Board], int],
+              prune_: Callable[[Node], Node],
+              static_eval_batch: Optional[Callable[[List[Board]],
+                                                   List[int]]] = None,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], int]:
     """Return a tree evaluation function"""
 
     def evaluate_(board: Board) -> int:
-        return maximize0(maptree(static_eval_, prune_(gametree_(board))))
+        if stats is None:
+            return maximize0(
+                score_tree(static_eval_, static_eval_batch,
+                           prune_(gametree_(board))))
+
+        stats.start()
+        return stats.finish(
+            maximize0(
+                stats.score_tree(static_eval_, static_eval_batch,
+                                 prune_(gametree_(board)))))
 
     return evaluate_
 
@@ -102,6 +254,137 @@ def map2_(func: Callable[[Node], Iterator[State]],
         yield replace_board(state0.board, func(subtree))
 
 
+# bound types of the scores in a transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+Entry = NamedTuple('Entry', [('score', int), ('ply', int), ('bound', int)])
+
+
+class TranspositionTable:
+    """Scores of searched positions, with bounded size"""
+
+    def __init__(self,
+                 max_entries: int = 100000,
+                 key: Callable[[Board], Hashable] = tuple,
+                 replace: str = 'lru'):
+        assert max_entries > 0
+        assert replace in ['lru', 'depth']
+        self.max_entries = max_entries
+        self.key = key
+        self.replace = replace
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def clear(self) -> None:
+        """Remove all entries, but keep the hit/miss counters"""
+        self.entries.clear()
+
+    def lookup(self, board: Board, ply: int, alpha: float,
+               beta: float) -> Optional[int]:
+        """Return the stored score if it can be used in (alpha, beta).
+        The tree must be pruned at the same depth on every branch.
+        """
+        k = self.key(board)
+        entry = self.entries.get(k)
+
+        if entry is not None and entry.ply <= ply:
+            if entry.bound == EXACT or \
+               (entry.bound == LOWER and entry.score >= beta) or \
+               (entry.bound == UPPER and entry.score <= alpha):
+                self.entries.move_to_end(k)
+                self.hits = self.hits + 1
+                return entry.score
+
+        self.misses = self.misses + 1
+        return None
+
+    def store(self, board: Board, ply: int, score: int, bound: int) -> None:
+        k = self.key(board)
+        if k in self.entries:
+            self.entries.move_to_end(k)
+        elif len(self.entries) >= self.max_entries:
+            oldest = next(iter(self.entries.values()))
+            if self.replace == 'depth' and oldest.ply < ply:
+                # keep the old entry, which was searched deeper
+                return
+            self.entries.popitem(last=False)
+        self.entries[k] = Entry(score, ply, bound)
+
+
+def mk_search_tt(static_eval_: Callable[[Board],
+                                        State], table: TranspositionTable,
+                 cutoff: bool) -> Callable[[Node], State]:
+    """Return a Minimax search function that uses a transposition table.
+    If cutoff is True, use alpha-beta pruning.
+    """
+
+    def search(node: Node, ply: int, alpha: float, beta: float,
+               maximizing: bool) -> int:
+        (board, subtrees) = node
+
+        if subtrees is None:
+            return static_eval_(board).score
+
+        score = table.lookup(board, ply, alpha, beta)
+        if score is not None:
+            return score
+
+        (alpha0, beta0) = (alpha, beta)
+        best = None
+        for subtree in subtrees:
+            s = search(subtree, ply + 1, alpha, beta, not maximizing)
+            if maximizing:
+                best = s if best is None else max(best, s)
+                if cutoff:
+                    alpha = max(alpha, s)
+            else:
+                best = s if best is None else min(best, s)
+                if cutoff:
+                    beta = min(beta, s)
+            if alpha >= beta:
+                break
+
+        if best is None:
+            # no legal moves
+            return static_eval_(board).score
+
+        if best <= alpha0:
+            table.store(board, ply, best, UPPER)
+        elif best >= beta0:
+            table.store(board, ply, best, LOWER)
+        else:
+            table.store(board, ply, best, EXACT)
+        return best
+
+    def search_(node: Node) -> State:
+        (board, subtrees) = node
+        table.clear()
+
+        if subtrees is None:
+            return static_eval_(board)
+
+        best = None
+        alpha = -inf
+        for subtree in subtrees:
+            s = search(subtree, 1, alpha, inf, False)
+            # the first of the best moves wins, just like max()
+            if best is None or s > best.score:
+                best = State(subtree.label, s)
+            if cutoff:
+                alpha = max(alpha, s)
+
+        if best is None:
+            # no legal moves
+            return static_eval_(board)
+        return best
+
+    return search_
+
+
 def maximize1_(node: Node) -> Iterator[State]:
     """The max step of Minimax before max"""
     (state, subtrees) = node
@@ -134,11 +417,35 @@ def minimize1(node: Node) -> State:
 
 def evaluate1(gametree_: Callable[[Board], Node],
               static_eval_: Callable[[Board], State],
-              prune_: Callable[[Node], Node]) -> Callable[[Board], State]:
+              prune_: Callable[[Node], Node],
+              table: Optional[TranspositionTable] = None,
+              static_eval_batch: Optional[Callable[[List[Board]],
+                                                   List[State]]] = None,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
     """Return a tree evaluation function"""
+    if table is not None and static_eval_batch is not None:
+        raise ValueError(
+            "static_eval_batch can't be used with a transposition table")
 
     def evaluate_(board: Board) -> State:
-        return maximize1(maptree(static_eval_, prune_(gametree_(board))))
+        if stats is None:
+            if table is None:
+                return maximize1(
+                    score_tree(static_eval_, static_eval_batch,
+                               prune_(gametree_(board))))
+            else:
+                return mk_search_tt(static_eval_, table,
+                                    False)(prune_(gametree_(board)))
+
+        stats.start()
+        if table is None:
+            best = maximize1(
+                stats.score_tree(static_eval_, static_eval_batch,
+                                 prune_(gametree_(board))))
+        else:
+            best = mk_search_tt(stats.static_eval(static_eval_), table,
+                                False)(stats.tree(prune_(gametree_(board))))
+        return stats.finish(best)
 
     return evaluate_
 
@@ -283,10 +590,332 @@ def minimize2(node: Node) -> State:
 
 def evaluate2(gametree_: Callable[[Board], Node],
               static_eval_: Callable[[Board], State],
-              prune_: Callable[[Node], Node]) -> Callable[[Board], State]:
+              prune_: Callable[[Node], Node],
+              table: Optional[TranspositionTable] = None,
+              static_eval_batch: Optional[Callable[[List[Board]],
+                                                   List[State]]] = None,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
     """Return a tree evaluation function"""
+    if table is not None and static_eval_batch is not None:
+        raise ValueError(
+            "static_eval_batch can't be used with a transposition table")
 
     def evaluate_(board: Board) -> State:
-        return maximize2(maptree(static_eval_, prune_(gametree_(board))))
+        if stats is None:
+            if table is None:
+                return maximize2(
+                    score_tree(static_eval_, static_eval_batch,
+                               prune_(gametree_(board))))
+            else:
+                return mk_search_tt(static_eval_, table,
+                                    True)(prune_(gametree_(board)))
+
+        stats.start()
+        if table is None:
+            best = maximize2(
+                stats.score_tree(static_eval_, static_eval_batch,
+                                 prune_(gametree_(board))))
+        else:
+            best = mk_search_tt(stats.static_eval(static_eval_), table,
+                                True)(stats.tree(prune_(gametree_(board))))
+        return stats.finish(best)
+
+    return evaluate_
+
+
+def negamax(static_eval_: Callable[[Board], State], node: Node, alpha: float,
+            beta: float, color: int) -> float:
+    """Alpha-beta pruning in the negamax style.
+    color is 1 for the max step, and -1 for the min step.
+    """
+    (state, subtrees) = node
+
+    if subtrees is None:
+        return color * static_eval_(state).score
+
+    best = -inf
+    for subtree in subtrees:
+        s = -negamax(static_eval_, subtree, -beta, -alpha, -color)
+        if s > best:
+            best = s
+        if s > alpha:
+            alpha = s
+        if alpha >= beta:
+            # the other player won't let us get here
+            break
+
+    if best == -inf:
+        # no legal moves
+        return color * static_eval_(state).score
+    return best
+
+
+def negamax_root(static_eval_: Callable[[Board], State], node: Node) -> State:
+    """Return the best move at the root of a tree"""
+    (state, subtrees) = node
+
+    if subtrees is None:
+        return static_eval_(state)
+
+    best = None
+    alpha = -inf
+    for subtree in subtrees:
+        s = -negamax(static_eval_, subtree, -inf, -alpha, -1)
+        # the first of the best moves wins, just like evaluate2
+        if best is None or s > best.score:
+            best = State(subtree.label, int(s))
+        alpha = max(alpha, s)
+
+    if best is None:
+        # no legal moves
+        return static_eval_(state)
+    return best
+
+
+def evaluate3(gametree_: Callable[[Board], Node],
+              static_eval_: Callable[[Board], State],
+              prune_: Callable[[Node], Node],
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
+    """Return a tree evaluation function"""
+
+    def evaluate_(board: Board) -> State:
+        if stats is None:
+            return negamax_root(static_eval_, prune_(gametree_(board)))
+
+        stats.start()
+        return stats.finish(
+            negamax_root(stats.static_eval(static_eval_),
+                         stats.tree(prune_(gametree_(board)))))
+
+    return evaluate_
+
+
+# the search functions of a worker process, set by init_worker
+worker: dict = {}
+
+SearchFunctions = Tuple[Callable[[Board], Node], Callable[[Board], State],
+                        Callable[[Node], Node]]
+
+
+def init_worker(functions: Callable[..., SearchFunctions], args: Tuple,
+                alpha: Any) -> None:
+    (worker['gametree_'], worker['static_eval_'],
+     worker['prune_']) = functions(*args)
+    worker['alpha'] = alpha
+
+
+def as_given(gametree_: Callable[[Board],
+                                 Node], static_eval_: Callable[[Board], State],
+             prune_: Callable[[Node], Node]) -> SearchFunctions:
+    """The search functions of a worker, passed as they are"""
+    return (gametree_, static_eval_, prune_)
+
+
+def search_root_move(board: Board, child: Board) -> float:
+    """Search the move from board to child in a worker process"""
+    root = Node(board, iter([worker['gametree_'](child)]))
+    (_, subtrees) = worker['prune_'](root)
+    subtree = next(subtrees)
+
+    alpha = worker['alpha']
+    bound = nextafter(alpha.value, -inf)
+    s = -negamax(worker['static_eval_'], subtree, -inf, -bound, -1)
+
+    with alpha.get_lock():
+        if s > alpha.value:
+            alpha.value = s
+    return s
+
+
+class SearchPool:
+    """Worker processes that search with the same evaluation functions.
+    Each worker gets its search functions from functions(*args).
+    """
+
+    def __init__(self,
+                 functions: Callable[..., SearchFunctions],
+                 args: Tuple = (),
+                 workers: Optional[int] = None,
+                 start_method: Optional[str] = None):
+        context = multiprocessing.get_context(start_method)
+        # the best score found so far, shared by the workers
+        self.alpha = context.Value('d', -inf)
+        self.executor = ProcessPoolExecutor(workers,
+                                            mp_context=context,
+                                            initializer=init_worker,
+                                            initargs=(functions, args,
+                                                      self.alpha))
+
+    def search(self, board: Board, children: List[Board]) -> List[float]:
+        """Search the moves from board to children, and return their scores"""
+        self.alpha.value = -inf
+        return list(
+            self.executor.map(search_root_move, repeat(board), children))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'SearchPool':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
+
+
+def evaluate_parallel(
+        gametree_: Callable[[Board], Node],
+        static_eval_: Callable[[Board], State],
+        prune_: Callable[[Node], Node],
+        workers: Optional[int] = None,
+        start_method: Optional[str] = None,
+        pool: Optional[SearchPool] = None) -> Callable[[Board], State]:
+    """Return a tree evaluation function that searches the moves in parallel"""
+
+    def evaluate_(board: Board) -> State:
+        (state, subtrees) = prune_(gametree_(board))
+
+        if subtrees is None:
+            return static_eval_(state)
+
+        children = [subtree.label for subtree in subtrees]
+        if pool is None:
+            with SearchPool(as_given, (gametree_, static_eval_, prune_),
+                            workers, start_method) as pool_:
+                scores = pool_.search(board, children)
+        else:
+            scores = pool.search(board, children)
+
+        best = None
+        for (child, s) in zip(children, scores):
+            if best is None or s > best.score:
+                best = State(child, int(s))
+
+        if best is None:
+            # no legal moves
+            return static_eval_(state)
+        return best
+
+    return evaluate_
+
+
+class SearchBudgetExceeded(Exception):
+    """A search has run out of time or nodes"""
+    pass
+
+
+def evaluate_iterative(
+    gametree_: Callable[[Board], Node],
+    static_eval_: Callable[[Board], State],
+    max_depth: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    node_limit: Optional[int] = None,
+    key: Callable[[Board], Hashable] = tuple
+) -> Callable[[Board], Iterator[State]]:
+    """Return a tree evaluation function that deepens the search iteratively.
+    The function yields the best State after each depth.
+    """
+
+    def evaluate_(board: Board) -> Iterator[State]:
+        start = time.perf_counter()
+        nodes = 0
+        # the budget is checked once the first move has been searched
+        budget = False
+        # whether the search has stopped before the end of the game
+        at_horizon = False
+        # scores of the previous depth, used for sorting subtrees
+        scores: dict = {}
+
+        def ordered(subtrees: Iterator[Node], maximizing: bool) -> List[Node]:
+
+            def previous_score(t: Node) -> float:
+                s = scores.get(key(t.label))
+                if s is None:
+                    return inf
+                else:
+                    return -s if maximizing else s
+
+            return sorted(subtrees, key=previous_score)
+
+        def over_budget() -> bool:
+            if node_limit is not None and nodes > node_limit:
+                return True
+            return time_limit is not None and time.perf_counter(
+            ) - start > time_limit
+
+        def search(node: Node, depth: int, alpha: float, beta: float,
+                   maximizing: bool, new_scores: dict) -> int:
+            nonlocal nodes, at_horizon
+            nodes = nodes + 1
+            if budget and over_budget():
+                raise SearchBudgetExceeded()
+
+            (board, subtrees) = node
+            if subtrees is None:
+                return static_eval_(board).score
+            if depth == 0:
+                at_horizon = True
+                return static_eval_(board).score
+
+            best: Optional[int] = None
+            for subtree in ordered(subtrees, maximizing):
+                s = search(subtree, depth - 1, alpha, beta, not maximizing,
+                           new_scores)
+                new_scores[key(subtree.label)] = s
+                if maximizing:
+                    best = s if best is None else max(best, s)
+                    alpha = max(alpha, s)
+                else:
+                    best = s if best is None else min(best, s)
+                    beta = min(beta, s)
+                if alpha >= beta:
+                    break
+
+            if best is None:
+                # no legal moves
+                return static_eval_(board).score
+            return best
+
+        depth = 1
+        while max_depth is None or depth <= max_depth:
+            (root, subtrees) = gametree_(board)
+            if subtrees is None:
+                yield static_eval_(root)
+                return
+
+            at_horizon = False
+            new_scores: dict = {}
+            # the moves in the order of gametree_, for breaking ties
+            moves = list(subtrees)
+            first = {id(subtree): i for (i, subtree) in enumerate(moves)}
+            best: Optional[State] = None
+            best_i = len(moves)
+            alpha = -inf
+            try:
+                for subtree in ordered(iter(moves), True):
+                    # just below alpha, so that a tie gets its exact score
+                    s = search(subtree, depth - 1, nextafter(alpha, -inf), inf,
+                               False, new_scores)
+                    new_scores[key(subtree.label)] = s
+                    i = first[id(subtree)]
+                    tie = best is not None and s == best.score and i < best_i
+                    if best is None or s > best.score or tie:
+                        (best, best_i) = (State(subtree.label, s), i)
+                    alpha = max(alpha, s)
+                    budget = True
+            except SearchBudgetExceeded:
+                if depth == 1 and best is not None:
+                    yield best
+                return
+
+            if best is None:
+                # no legal moves
+                yield static_eval_(root)
+                return
+            yield best
+            if not at_horizon:
+                # the whole tree has been searched
+                return
+            scores = new_scores
+            depth = depth + 1
 
     return evaluate_
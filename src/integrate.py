@@ -1,6 +1,10 @@
-from typing import Callable, Iterator, Tuple
-from lazy_utils import within
-from diff import improve
+from typing import Callable, Iterator, Tuple, NamedTuple, Optional, Any
+from math import fsum
+import heapq
+import numpy as np
+from lazy_utils import within, within_limited, Estimate
+from itertools import count
+from diff import improve, richardson
 
 esp = 0.0000000001  # a small number that's used to call within()
 
@@ -51,3 +55,129 @@ def integrate2(f: Callable[[float], float], a: float, b: float) -> float:
 def integrate3(f: Callable[[float], float], a: float, b: float) -> float:
     d = within(esp, improve(integ(f, a, b, f(a), f(b))))
     return next(d)
+
+
+def trapezoids(f: Callable[[np.ndarray], np.ndarray], a: float,
+               b: float) -> Iterator[float]:
+    """Like integ, but f is vectorized and evaluated once per level."""
+    (fa, fb) = f(np.array([a, b]))
+    t = float((fa + fb) * (b - a) / 2.0)
+    n = 1
+    while True:
+        yield t
+        h = (b - a) / n
+        mid = a + (np.arange(n) + 0.5) * h
+        t = t / 2.0 + float(np.sum(f(mid))) * h / 2.0
+        n = 2 * n
+
+
+def integrate2_array(f: Callable[[np.ndarray], np.ndarray], a: float,
+                     b: float) -> float:
+    """Like integrate2, but f is vectorized."""
+    d = within(esp, trapezoids(f, a, b))
+    return next(d)
+
+
+def integrate3_array(f: Callable[[np.ndarray], np.ndarray], a: float,
+                     b: float) -> float:
+    """Like integrate3, but f is vectorized."""
+    d = within(esp, improve(trapezoids(f, a, b)))
+    return next(d)
+
+
+def romberg(itr: Iterator[float]) -> Iterator[float]:
+    """richardson(itr), with the known orders of the trapezoidal rule."""
+    return richardson(itr, orders=count(2, 2))
+
+
+def integrate4(f: Callable[[float], float], a: float, b: float) -> float:
+    d = within(esp, romberg(integ(f, a, b, f(a), f(b))))
+    return next(d)
+
+
+def integrate4_array(f: Callable[[np.ndarray], np.ndarray], a: float,
+                     b: float) -> float:
+    """Like integrate4, but f is vectorized."""
+    d = within(esp, romberg(trapezoids(f, a, b)))
+    return next(d)
+
+
+Segment = NamedTuple('Segment', [('a', float), ('b', float), ('fa', float),
+                                 ('fl', float), ('fm', float), ('fr', float),
+                                 ('fb', float), ('value', float),
+                                 ('error', float)])
+
+Quadrature = NamedTuple('Quadrature', [('value', float), ('error', float),
+                                       ('evaluations', int)])
+
+
+def simpson(a: float, b: float, fa: float, fm: float, fb: float) -> float:
+    """Simpson's rule in (a, b), with pre-calculated f(a), f(m) and f(b)."""
+    return (fa + 4.0 * fm + fb) * (b - a) / 6.0
+
+
+def segment(f: Callable[[float], float], a: float, b: float, fa: float,
+            fm: float, fb: float) -> Segment:
+    """Approximate the integral in (a, b), and estimate the error.
+    f is evaluated twice.
+    """
+    m = (a + b) / 2.0
+    (fl, fr) = (f((a + m) / 2.0), f((m + b) / 2.0))
+    whole = simpson(a, b, fa, fm, fb)
+    halves = simpson(a, m, fa, fl, fm) + simpson(m, b, fm, fr, fb)
+    return Segment(a, b, fa, fl, fm, fr, fb, halves,
+                   abs(halves - whole) / 15.0)
+
+
+def integrate_adaptive(f: Callable[[float], float],
+                       a: float,
+                       b: float,
+                       tol: float = esp,
+                       max_evaluations: Optional[int] = None) -> Quadrature:
+    """Calculate the integral of f between a and b.
+    Stop when the estimated error is below tol, or when f has been
+    evaluated max_evaluations times.
+    """
+    m = (a + b) / 2.0
+    s = segment(f, a, b, f(a), f(m), f(b))
+    evaluations = 5
+    # the heap is ordered by -error, so the worst segment comes first
+    # ties are broken by count, so that segments are never compared
+    count = 0
+    heap = [(-s.error, count, s)]
+    error = s.error
+
+    while error > tol:
+        if max_evaluations is not None and evaluations + 4 > max_evaluations:
+            break
+        (_, _, s) = heapq.heappop(heap)
+        m = (s.a + s.b) / 2.0
+        left = segment(f, s.a, m, s.fa, s.fl, s.fm)
+        right = segment(f, m, s.b, s.fm, s.fr, s.fb)
+        evaluations = evaluations + 4
+        for t in [left, right]:
+            count = count + 1
+            heapq.heappush(heap, (-t.error, count, t))
+        error = error - s.error + left.error + right.error
+
+    segments = [t for (_, _, t) in heap]
+    return Quadrature(fsum(t.value for t in segments),
+                      fsum(t.error for t in segments), evaluations)
+
+
+def integrate2_limited(f: Callable[[float], float], a: float, b: float,
+                       **limits: Any) -> Estimate:
+    """Like integrate2, but give up if a limit is reached."""
+    return within_limited(esp, integ(f, a, b, f(a), f(b)), **limits)
+
+
+def integrate3_limited(f: Callable[[float], float], a: float, b: float,
+                       **limits: Any) -> Estimate:
+    """Like integrate3, but give up if a limit is reached."""
+    return within_limited(esp, improve(integ(f, a, b, f(a), f(b))), **limits)
+
+
+def integrate4_limited(f: Callable[[float], float], a: float, b: float,
+                       **limits: Any) -> Estimate:
+    """Like integrate4, but give up if a limit is reached."""
+    return within_limited(esp, romberg(integ(f, a, b, f(a), f(b))), **limits)
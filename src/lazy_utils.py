@@ -1,11 +1,17 @@
-from typing import Callable, Iterator, NamedTuple, Any, Optional, Union
-from itertools import tee
+from typing import Callable, Iterator, NamedTuple, Any, Optional, Union, List
+from typing import TypeVar
+from itertools import islice, tee
+from collections import deque
+from math import comb, inf, isnan
 import operator
+import time
 
+T = TypeVar('T')
 
-def repeat_f(f: Callable[[float], float], a: float) -> Iterator[float]:
+
+def repeat_f(f: Callable[[T], T], a: T) -> Iterator[T]:
     """Infinite iterator: [a, f(a), f(f(a)), f(f(f(a))) ...]"""
-    acc: float = a
+    acc: T = a
 
     while True:
         yield acc
@@ -34,6 +40,160 @@ def relative(esp: float, itr: Iterator[float]) -> Iterator[float]:
             a = b
 
 
+Estimate = NamedTuple('Estimate', [('value', Any), ('status', str),
+                                   ('iterations', int)])
+
+
+def converge(delta: Callable[[Any, Any], float],
+             esp: float,
+             itr: Iterator,
+             max_iterations: Optional[int] = 1000,
+             timeout: Optional[float] = None,
+             patience: Optional[int] = 10) -> Estimate:
+    """Stop when two successive values are close, or at a limit."""
+    start = time.perf_counter()
+    (a, best, smallest, stale, i) = (None, None, inf, 0, 0)
+    (last, growing) = (inf, 0)  # the previous delta, and how long it has grown
+    for b in itr:
+        i = i + 1
+        if i == 1:
+            (a, best) = (b, b)
+            continue
+
+        d = delta(a, b)
+        if d <= esp:
+            return Estimate(b, 'converged', i)
+        if isnan(d):
+            return Estimate(best, 'diverged', i)
+        if d < smallest:
+            (best, smallest, stale) = (b, d, 0)
+        else:
+            stale = stale + 1
+        (last, growing) = (d, growing + 1 if d > last else 0)
+
+        if patience is not None and stale >= patience:
+            return Estimate(best,
+                            'diverged' if growing >= patience else 'stalled',
+                            i)
+        if max_iterations is not None and i >= max_iterations:
+            return Estimate(best, 'max_iterations', i)
+        if timeout is not None and time.perf_counter() - start >= timeout:
+            return Estimate(best, 'timeout', i)
+        a = b
+    # a finite iterator
+    return Estimate(best, 'exhausted', i)
+
+
+def within_limited(esp: float,
+                   itr: Iterator[float],
+                   max_iterations: Optional[int] = 1000,
+                   timeout: Optional[float] = None,
+                   patience: Optional[int] = 10) -> Estimate:
+    """Like within, but give up if a limit is reached."""
+    return converge(lambda a, b: abs(a - b), esp, itr, max_iterations, timeout,
+                    patience)
+
+
+def relative_delta(a: float, b: float) -> float:
+    """abs(a/b - 1), without dividing by 0"""
+    if b == 0:
+        return 0.0 if a == 0 else inf
+    return abs((a - b) / b)
+
+
+def relative_limited(esp: float,
+                     itr: Iterator[float],
+                     max_iterations: Optional[int] = 1000,
+                     timeout: Optional[float] = None,
+                     patience: Optional[int] = 10) -> Estimate:
+    """Like relative, but give up if a limit is reached."""
+    return converge(relative_delta, esp, itr, max_iterations, timeout,
+                    patience)
+
+
+def aitken(itr: Iterator[float]) -> Iterator[float]:
+    """Aitken's delta-squared process"""
+    a = next(itr)
+    b = next(itr)
+    for c in itr:
+        d = (c - b) - (b - a)
+        if d == 0:
+            yield c
+        else:
+            yield c - (c - b)**2 / d
+        (a, b) = (b, c)
+
+
+def wynn(itr: Iterator[float], k: int = 3) -> Iterator[float]:
+    """Shanks transformation of order k, using Wynn's epsilon algorithm"""
+    prev: List[float] = []
+    for v in itr:
+        diag = [v]
+        for j in range(1, min(len(prev) + 1, 2 * k + 1)):
+            d = diag[j - 1] - prev[j - 1]
+            if d == 0:
+                break
+            diag.append((prev[j - 2] if j > 1 else 0.0) + 1.0 / d)
+        prev = diag
+        yield diag[(len(diag) - 1) // 2 * 2]
+
+
+def levin(itr: Iterator[float],
+          k: int = 10,
+          beta: float = 1.0) -> Iterator[float]:
+    """Levin's u-transformation of order (at most) k"""
+    window: deque = deque(maxlen=k + 1)  # values and remainder estimates
+    prev = 0.0
+    for (n, v) in enumerate(itr):
+        (term, prev) = (v - prev, v)
+        if term == 0:
+            # converged. Start again from the next value.
+            window.clear()
+            yield v
+            continue
+        window.append((v, (n + beta) * term))
+
+        m = len(window) - 1
+        (num, den) = (0.0, 0.0)
+        for (j, (s, w)) in enumerate(window):
+            ratio = (n - m + j + beta) / (n + beta)
+            c = (-1)**j * comb(m, j) * ratio**(m - 1) / w
+            num = num + c * s
+            den = den + c
+        yield num / den
+
+
+class Stream:
+    """A memoized lazy list of the values of an iterator"""
+    __slots__ = ('cell', 'source')
+    cell: List[Any]
+    source: Iterator
+
+    def __init__(self, itr: Iterator):
+        if isinstance(itr, Stream):
+            (self.cell, self.source) = (itr.cell, itr.source)
+        else:
+            # a cell is [value, next cell]. The next cell is None until
+            # it's needed. The first cell is a placeholder.
+            (self.cell, self.source) = ([None, None], itr)
+
+    def __iter__(self) -> 'Stream':
+        return self
+
+    def __next__(self) -> Any:
+        cell = self.cell[1]
+        if cell is None:
+            cell = self.cell[1] = [next(self.source), None]
+        self.cell = cell
+        return cell[0]
+
+    def __copy__(self) -> 'Stream':
+        return Stream(self)
+
+    def __getitem__(self, i: int) -> Any:
+        return next(islice(Stream(self), i, None))
+
+
 def repeat_itr(f: Callable[[Iterator], Iterator], i: Iterator) -> Iterator:
     """[i, f(i), f(f(i))...]"""
     acc: Iterator[float] = i
@@ -68,10 +228,10 @@ def foldtree(f: Callable, g: Callable, a: Any, t: Union[Node, Iterator, None]):
             return a
 
 
-def sumtree(t: Node) -> int:
+def sumtree(t: Node, fold: Callable = foldtree) -> int:
     """Sum all the labels in a tree"""
     add = operator.add
-    return foldtree(add, add, 0, t)
+    return fold(add, add, 0, t)
 
 
 def tree_labels(t: Node) -> Iterator:
@@ -95,32 +255,34 @@ def tree_labels(t: Node) -> Iterator:
     return foldtree(f, g, None, t)
 
 
-def maptree(func: Callable, t: Node) -> Node:
+def maptree(func: Callable, t: Node, fold: Callable = foldtree) -> Node:
     """Maps func to all labels in a tree. Returns another lazy tree"""
 
-    def f(label: Any, folded_subtrees: Optional[Iterator]) -> Node:
-        return Node(func(label), folded_subtrees)
+    def f(label: Any, folded_subtrees: Optional[deque]) -> Node:
+        if folded_subtrees is None:
+            return Node(func(label), None)
+        else:
+            return Node(func(label), iter(folded_subtrees))
 
-    def g(folded_first: Node,
-          folded_rest: Optional[Iterator]) -> Optional[Iterator]:
-        yield folded_first
-        if folded_rest is not None:
-            for item in folded_rest:
-                yield item
+    def g(folded_first: Node, folded_rest: Optional[deque]) -> deque:
+        if folded_rest is None:
+            folded_rest = deque()
+        folded_rest.appendleft(folded_first)
+        return folded_rest
 
-    return foldtree(f, g, None, t)
+    return fold(f, g, None, t)
 
 
-def tree_size(t: Node) -> int:
+def tree_size(t: Node, fold: Callable = foldtree) -> int:
     """Return the number of labels in a lazy tree"""
 
     def f(label: Any, folded_subtrees: int) -> int:
         return 1 + folded_subtrees
 
-    return foldtree(f, operator.add, 0, t)
+    return fold(f, operator.add, 0, t)
 
 
-def tree_depth(t: Node) -> int:
+def tree_depth(t: Node, fold: Callable = foldtree) -> int:
     """Return the length of the longist branch in the tree"""
 
     def f(label: Any, folded_subtrees: int) -> int:
@@ -129,7 +291,84 @@ def tree_depth(t: Node) -> int:
     def g(folded_first: int, folded_rest: int) -> int:
         return max(folded_first, folded_rest)
 
-    return foldtree(f, g, 0, t)
+    return fold(f, g, 0, t)
+
+
+def foldtree_stack(f: Callable, g: Callable, a: Any, t: Union[Node, Iterator,
+                                                              None]):
+    """Same as foldtree, but use an explicit stack instead of recursion.
+    f: fold a node's label to the folded subtrees
+    g: fold a list of subtrees
+    a: an initial constant
+    t: a tree, an iterator of subtrees, or None
+    """
+    if t is None:
+        return a
+
+    is_node = isinstance(t, Node)
+    # a frame is (label, iterator of subtrees, folded subtrees)
+    stack: List[Any] = [(None, iter([t]) if is_node else t, [])]
+    while True:
+        (label, subtrees, folded) = stack[-1]
+        subtree = next(subtrees, None)
+        if subtree is not None:
+            (sub_label, sub_subtrees) = subtree
+            if sub_subtrees is None:
+                folded.append(f(sub_label, a))
+            else:
+                stack.append((sub_label, sub_subtrees, []))
+        else:
+            stack.pop()
+            if len(stack) == 0:
+                # the root frame only holds the tree (or the subtrees) to fold
+                return folded[0] if is_node else fold_siblings(g, a, folded)
+            stack[-1][2].append(f(label, fold_siblings(g, a, folded)))
+
+
+def fold_siblings(g: Callable, a: Any, folded: List) -> Any:
+    """g(folded[0], g(folded[1], ... g(folded[-1], a)))"""
+    acc = a
+    for item in reversed(folded):
+        acc = g(item, acc)
+    return acc
+
+
+def maptree_batched(func_batch: Callable[[List], List],
+                    t: Node,
+                    batch_size: int = 4096) -> Node:
+    """Like maptree, but map func_batch to lists of labels"""
+    labels: List[Any] = []
+    # the indices of the subtrees of each node (none for a leaf)
+    children: List[List[int]] = []
+
+    def add(node: Node) -> int:
+        labels.append(node.label)
+        children.append([])
+        return len(labels) - 1
+
+    stack = [(add(t), t.subtrees)]
+    while len(stack) > 0:
+        (i, subtrees) = stack[-1]
+        subtree = None if subtrees is None else next(subtrees, None)
+        if subtree is None:
+            stack.pop()
+        else:
+            j = add(subtree)
+            children[i].append(j)
+            stack.append((j, subtree.subtrees))
+
+    mapped: List[Any] = []
+    for k in range(0, len(labels), batch_size):
+        mapped.extend(func_batch(labels[k:k + batch_size]))
+
+    # subtrees always come after their parent
+    nodes: List[Any] = [None] * len(labels)
+    for i in range(len(labels) - 1, -1, -1):
+        if children[i]:
+            nodes[i] = Node(mapped[i], iter([nodes[j] for j in children[i]]))
+        else:
+            nodes[i] = Node(mapped[i], None)
+    return nodes[0]
 
 
 def reptree(f: Callable[[Any], Optional[Iterator[Any]]], label: Any) -> Node:
@@ -1,5 +1,11 @@
-from typing import Callable, Iterator
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Tuple, Union
+from itertools import count
+from math import nan, sqrt
+from decimal import Context, Decimal, getcontext, MAX_EMAX, MIN_EMIN
+from operator import attrgetter
+import numpy as np
 from lazy_utils import *
+from diff import diff1, diff2
 
 
 def next_sqrt_approx(n: float) -> Callable[[float], float]:
@@ -26,3 +32,260 @@ def newton_sqrt_relative(n: float, a: float) -> float:
     """Approximate sqrt(n) starting from a, using the Newton-Raphson method."""
     r = relative(0.00001, repeat_f(next_sqrt_approx(n), a))
     return next(r)
+
+
+def newton_sqrt_limited(n: float, a: float, **limits: Any) -> Estimate:
+    """Like newton_sqrt, but give up if a limit is reached."""
+    return within_limited(0.00001, repeat_f(next_sqrt_approx(n), a), **limits)
+
+
+def repeat_array(
+        f: Callable[[Any], Callable[[Any], Any]],
+        close: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        n: np.ndarray,
+        a: Union[float, np.ndarray],
+        max_iterations: Optional[int] = 10000
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply f(n) to a elementwise, until two successive values are close"""
+    n = np.asarray(n, dtype=float)
+    shape = n.shape
+    n = n.ravel()
+    x = np.broadcast_to(np.asarray(a, dtype=float), shape).ravel().copy()
+    iterations = np.zeros(n.shape, dtype=int)
+
+    active = np.arange(n.size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in count() if max_iterations is None else range(max_iterations):
+            if active.size == 0:
+                break
+            x0 = x[active]
+            x1 = f(n[active])(x0)
+            x[active] = x1
+            iterations[active] = iterations[active] + 1
+            active = active[~(close(x0, x1) | ~np.isfinite(x1))]
+
+    return (x.reshape(shape), iterations.reshape(shape))
+
+
+def within_array(esp: float) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    return lambda a, b: np.abs(a - b) <= esp
+
+
+def relative_array(
+        esp: float) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    return lambda a, b: np.abs(a / b - 1) <= esp
+
+
+def non_negative(n: np.ndarray) -> np.ndarray:
+    """n, with nan in place of the negative elements"""
+    n = np.asarray(n, dtype=float)
+    return np.where(n < 0, np.nan, n)
+
+
+def newton_sqrt_array(n: np.ndarray,
+                      a: Union[float, np.ndarray],
+                      esp: float = 0.00001) -> Tuple[np.ndarray, np.ndarray]:
+    """Like newton_sqrt, for an array.
+    Also return the number of iterations.
+    """
+    return repeat_array(next_sqrt_approx, within_array(esp), non_negative(n),
+                        a)
+
+
+def newton_sqrt_relative_array(
+        n: np.ndarray,
+        a: Union[float, np.ndarray],
+        esp: float = 0.00001) -> Tuple[np.ndarray, np.ndarray]:
+    """Like newton_sqrt_relative, for an array.
+    Also return the number of iterations.
+    """
+    return repeat_array(next_sqrt_approx, relative_array(esp), non_negative(n),
+                        a)
+
+
+def next_isqrt_approx(n: int) -> Callable[[Tuple[int, int]], Tuple[int, int]]:
+    """Next step in the approximation of sqrt(n), with twice as many bits"""
+    b = (n.bit_length() + 1) // 2  # the number of bits of sqrt(n)
+
+    def next_approx_(state: Tuple[int, int]) -> Tuple[int, int]:
+        (s, x) = state
+        t = max(0, 2 * s - b)
+        x = x << (s - t)
+        m = n >> (2 * t)
+        return (t, (x + m // x) // 2)
+
+    return next_approx_
+
+
+def newton_isqrt_(n: int) -> Iterator[Tuple[int, int]]:
+    """An infinite iterator approximating sqrt(n), with increasing precision"""
+    # a float is precise enough for the first 26 bits
+    s = max(0, (n.bit_length() + 1) // 2 - 26)
+    x = max(1, int(sqrt(n >> (2 * s))))
+    return repeat_f(next_isqrt_approx(n), (s, x))
+
+
+def newton_isqrt(n: int) -> int:
+    """The integer square root of n, using the Newton-Raphson method."""
+    if n < 0:
+        raise ValueError('square root of a negative number')
+    if n == 0:
+        return 0
+    full = (x for (s, x) in newton_isqrt_(n) if s == 0)
+    r = int(next(within(1, full)))
+    while r * r > n:
+        r = r - 1
+    while (r + 1) * (r + 1) <= n:
+        r = r + 1
+    return r
+
+
+def newton_sqrt_decimal(n: Decimal, prec: Optional[int] = None) -> Decimal:
+    """sqrt(n), correctly rounded to prec digits.
+    The default is the precision of the current context.
+    """
+    if prec is None:
+        prec = getcontext().prec
+    context = Context(prec=prec, Emax=MAX_EMAX, Emin=MIN_EMIN)
+    if n.is_nan():
+        # NaN, or InvalidOperation for a signaling NaN
+        return n.sqrt(context)
+    if n.is_signed() and not n.is_zero():
+        raise ValueError('square root of a negative number')
+    if n.is_infinite():
+        return n
+
+    (sign, digits, e) = n.as_tuple()
+    assert isinstance(e, int)  # n is finite
+    if n.is_zero():
+        # the sign is kept, and the exponent is halved
+        return Decimal((sign, (0, ), e // 2))
+    s = max(0, 2 * prec + 2 - len(digits))
+    s = s + (e - s) % 2
+    c = int(Decimal((0, digits, s)))
+    r = newton_isqrt(c)
+
+    # c has len(digits) + s digits, and r has half of them (rounded up)
+    drop = (len(digits) + s + 1) // 2 - prec
+    (q, rem) = divmod(r, 10**drop)
+    half = 5 * 10**(drop - 1)
+    if rem > half or (rem == half and (r * r != c or q % 2 == 1)):
+        q = q + 1
+    if q == 10**prec:
+        (q, drop) = (q // 10, drop + 1)
+    exp = drop + (e - s) // 2
+    if rem == 0 and r * r == c:
+        # the square root is exact. Its trailing zeros are dropped,
+        # down to half the exponent of n
+        while exp < e // 2 and q % 10 == 0:
+            (q, exp) = (q // 10, exp + 1)
+    return Decimal(q).scaleb(exp, context)
+
+
+NewtonState = NamedTuple('NewtonState', [('x', float), ('fx', float),
+                                         ('slope', Optional[float]),
+                                         ('age', int), ('lo', Optional[float]),
+                                         ('flo', Optional[float]),
+                                         ('hi', Optional[float])])
+
+
+def next_root_approx(f: Callable[[float], float],
+                     df: Callable[[float], float],
+                     reuse: int = 1) -> Callable[[NewtonState], NewtonState]:
+    """Next step of Newton's method.
+    The derivative df is evaluated every reuse steps.
+    """
+
+    def next_approx_(s: NewtonState) -> NewtonState:
+        if s.fx == 0:
+            return s
+        (slope, age) = (s.slope, s.age)
+        if slope is None or age >= reuse:
+            (slope, age) = (df(s.x), 0)
+        x = s.x - s.fx / slope if slope != 0 else nan
+        if s.lo is None:
+            if slope == 0:
+                raise ZeroDivisionError('the derivative is 0')
+            fx = f(x)
+            return NewtonState(x, fx, slope, age + 1, None, None, None)
+
+        assert s.flo is not None and s.hi is not None
+        if not s.lo < x < s.hi:
+            # bisect, and evaluate the derivative again in the next step
+            (x, age) = ((s.lo + s.hi) / 2.0, reuse)
+        fx = f(x)
+        if (fx < 0) == (s.flo < 0):
+            return NewtonState(x, fx, slope, age + 1, x, fx, s.hi)
+        else:
+            return NewtonState(x, fx, slope, age + 1, s.lo, s.flo, x)
+
+    return next_approx_
+
+
+def approx_derivative(f: Callable[[float], float],
+                      derivative: Callable = diff2,
+                      h0: float = 0.01) -> Callable[[float], float]:
+    """Approximate the derivative of f with derivative(h0, f, x)"""
+
+    def df(x: float) -> float:
+        try:
+            return derivative(h0, f, x)
+        except (ValueError, ZeroDivisionError):
+            return diff1(h0, f, x)
+
+    return df
+
+
+def newton_root(f: Callable[[float], float],
+                x0: float,
+                df: Optional[Callable[[float], float]] = None,
+                reuse: int = 1,
+                bracket: Optional[Tuple[float, float]] = None,
+                derivative: Callable = diff2,
+                h0: float = 0.01) -> Iterator[float]:
+    """An infinite iterator approximating a root of f starting from x0"""
+    if df is None:
+        df = approx_derivative(f, derivative, h0)
+    if bracket is None:
+        s = NewtonState(x0, f(x0), None, reuse, None, None, None)
+    else:
+        (lo, hi) = bracket
+        (flo, fhi) = (f(lo), f(hi))
+        if (flo < 0) == (fhi < 0):
+            raise ValueError('f has the same sign at both ends of the bracket')
+        s = NewtonState(x0, f(x0), None, reuse, lo, flo, hi)
+    return map(attrgetter('x'), repeat_f(next_root_approx(f, df, reuse), s))
+
+
+Root = NamedTuple('Root', [('x', float), ('iterations', int),
+                           ('evaluations', int), ('derivatives', int)])
+
+
+def find_root(f: Callable[[float], float],
+              x0: float,
+              df: Optional[Callable[[float], float]] = None,
+              reuse: int = 1,
+              bracket: Optional[Tuple[float, float]] = None,
+              derivative: Callable = diff2,
+              h0: float = 0.01,
+              esp: float = 0.00001,
+              stop: Callable = within) -> Root:
+    """Approximate a root of f with newton_root, and count the evaluations"""
+    calls = {'f': 0, 'df': 0}
+
+    def f_(x: float) -> float:
+        calls['f'] = calls['f'] + 1
+        return f(x)
+
+    df0 = df if df is not None else approx_derivative(f_, derivative, h0)
+
+    def df_(x: float) -> float:
+        calls['df'] = calls['df'] + 1
+        return df0(x)
+
+    # zip advances the counter once for each approximation
+    approximations = count()
+    xs = newton_root(f_, x0, df_, reuse, bracket)
+    r = stop(esp, (x for (x, _) in zip(xs, approximations)))
+    x = next(r)
+    return Root(x, next(approximations) - 1, calls['f'], calls['df'])
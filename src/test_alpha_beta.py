@@ -133,3 +133,35 @@ def test_mapmax():
 
     seqs = iter([iter([1, 2]), iter([0, 10]), iter([3, 20]), iter([1, 100])])
     assert list(mapmax(seqs)) == [2]
+
+
+def test_evaluate3_wide_tree():
+    n = 5000
+
+    def static_eval_(board):
+        return State(board, (board * 7919) % 1000)
+
+    def moves(board):
+        # board is an integer, and there are n moves from 0
+        return iter(range(1, n + 1)) if board == 0 else None
+
+    best = evaluate3(gametree(moves), static_eval_, lambda t: t)(0)
+    assert best.score == max(static_eval_(b).score for b in range(1, n + 1))
+    assert static_eval_(best.board).score == best.score
+
+    def moves2(board):
+        # two plies: 3 moves from 0, and n moves from each of them
+        if board == 0:
+            return iter([1, 2, 3])
+        elif board <= 3:
+            return iter(range(board * n + 1, board * n + n + 1))
+        else:
+            return None
+
+    best = evaluate3(gametree(moves2), static_eval_, lambda t: t)(0)
+    mins = [
+        min(static_eval_(b).score for b in range(m * n + 1, m * n + n + 1))
+        for m in [1, 2, 3]
+    ]
+    assert best.score == max(mins)
+    assert best.board == mins.index(max(mins)) + 1
@@ -0,0 +1,47 @@
+import operator
+import numpy as np
+
+import foldtree
+from foldtree import Node
+from array_tree import *
+from test_foldtree import my_tree, my_tree2
+
+
+def test_from_node():
+    t = from_node(my_tree)
+    assert t.labels.tolist() == [1, 2, 3, 4]
+    assert t.offsets.tolist() == [0, 2, 2, 3, 3]
+    assert t.children.tolist() == [1, 2, 3]
+    assert t.levels.tolist() == [0, 1, 3, 4]
+
+    for t in [Node(1, []), my_tree, my_tree2]:
+        assert to_node(from_node(t)) == t
+
+
+def test_array_tree_ops():
+    for t in [Node(1, []), my_tree, my_tree2]:
+        a = from_node(t)
+        assert sumtree(a) == foldtree.sumtree(t)
+        assert tree_size(a) == foldtree.tree_size(t)
+        assert tree_depth(a) == foldtree.tree_depth(t)
+
+        res = to_node(maptree(lambda x: -1 * x, a))
+        assert res == foldtree.maptree(lambda x: -1 * x, t)
+
+
+def test_array_tree_wide_tree():
+    n = 100000
+    t = from_node(Node(0, [Node(i, [Node(i, [])]) for i in range(n)]))
+
+    assert sumtree(t) == n * (n - 1)
+    assert tree_size(t) == 2 * n + 1
+    assert tree_depth(t) == 3
+    assert sumtree(maptree(lambda x: x + 1, t)) == n * (n - 1) + 2 * n + 1
+
+
+def test_foldtree_array():
+    # the folded value at a node that has no subtrees is f(label, a)
+    t = from_node(my_tree2)
+    res = foldtree_array(lambda labels, x: labels * 0 + x, np.add, 1, t)
+    assert res == foldtree.foldtree(lambda label, x: x, operator.add, 1,
+                                    my_tree2)
@@ -0,0 +1,91 @@
+import pytest
+from benchmark import *
+import benchmark
+
+
+def test_counted():
+    f = Counted(sin)
+    assert integrate.integrate2(f, 0.0, pi) == pytest.approx(2.0)
+    g = Counted(sin)
+    integrate.integrate1(g, 0.0, pi)
+    # integrate2 doesn't evaluate f twice at the same point
+    assert 0 < f.calls < g.calls
+
+
+def test_complete_tree():
+    t = complete_tree(100, 3)
+    assert foldtree.tree_size(t) == 100
+    assert lazy_utils.tree_size(lazy_tree(t)) == 100
+    assert sorted(foldtree.tree_labels(t)) == list(range(100))
+    assert list(lazy_utils.tree_labels(
+        lazy_tree(t))) == foldtree.tree_labels(t)
+
+
+def test_compare():
+    baseline = {
+        'a': {
+            'time': 1.0,
+            'nodes': 10
+        },
+        'b': {
+            'time': 1.0
+        },
+        'c': {
+            'time': 1.0
+        }
+    }
+    assert compare({
+        'a': {
+            'time': 1.2,
+            'nodes': 10
+        },
+        'b': {
+            'time': 0.5
+        }
+    }, baseline) == []
+    assert len(compare({'a': {'time': 1.3, 'nodes': 10}}, baseline)) == 1
+    assert len(compare({'a': {'time': 1.0, 'nodes': 11}}, baseline)) == 1
+    assert len(
+        compare({'a': {
+            'time': 1.3,
+            'nodes': 11
+        }}, baseline, threshold=0.5)) == 1
+    # new benchmarks are not regressions
+    assert compare({'d': {'time': 1.0}}, baseline) == []
+
+
+def test_bench_search(monkeypatch):
+    # only the counts are tested
+    monkeypatch.setattr(benchmark, 'timed', lambda func: 0.0)
+    results = bench_search([0, 1, None, None, 0, None, 0, None, 1])
+    assert len(results) == 3 * tic_tac_toe.max_depth
+    for depth in range(1, tic_tac_toe.max_depth + 1):
+        # alpha-beta pruning visits fewer nodes, but scores the same boards
+        r1 = results['search/evaluate1/%d' % depth]
+        r2 = results['search/evaluate2/%d' % depth]
+        assert r2['nodes'] <= r1['nodes']
+        assert r2['evaluations'] == r1['evaluations']
+
+
+def test_run(monkeypatch):
+    monkeypatch.setattr(benchmark, 'timed', lambda func: 0.0)
+    monkeypatch.setattr(tic_tac_toe, 'max_depth', 2)
+    results = run('search/evaluate2')
+    assert sorted(results) == ['search/evaluate2/1', 'search/evaluate2/2']
+
+    # the folds and the searches are not run
+    calls = []
+    monkeypatch.setattr(benchmark, 'bench_folds', lambda: calls.append('fold'))
+    monkeypatch.setattr(benchmark, 'bench_search',
+                        lambda: calls.append('search'))
+    monkeypatch.setattr(
+        benchmark, 'bench_numerical', lambda: {
+            'sqrt/x': {
+                'time': 0.0
+            },
+            'diff/x': {
+                'time': 0.0
+            }
+        })
+    assert main(['--select', 'sqrt/']) == 0
+    assert calls == []
@@ -1,6 +1,11 @@
+import gc
+import random
+import weakref
 import pytest
+import numpy as np
+from copy import copy
 from itertools import *
-from math import cos, sin
+from math import cos, sin, isnan
 
 from lazy_utils import *
 from diff import *
@@ -16,6 +21,49 @@ def test_diff1():
     assert d == pytest.approx(cos(x))
 
 
+def test_stream():
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        return x + 1
+
+    s1 = Stream(repeat_f(f, 0))
+    s2 = copy(s1)
+    assert list(islice(s1, 5)) == [0, 1, 2, 3, 4]
+    assert (s2[0], s2[6], s1[0]) == (0, 6, 5)
+    assert list(islice(s2, 5)) == [0, 1, 2, 3, 4]
+    s3 = Stream(s2)
+    assert (next(s2), next(s2), next(s3)) == (5, 6, 5)
+    # every value is computed once
+    assert calls == list(range(6))
+
+    # finite iterators
+    s = Stream(iter([1, 2]))
+    assert (list(copy(s)), list(s), list(s)) == ([1, 2], [1, 2], [])
+
+    # values are released when no copy needs them
+    class Value:
+        pass
+
+    values = []
+
+    def values_():
+        while True:
+            v = Value()
+            values.append(weakref.ref(v))
+            yield v
+
+    s1 = Stream(values_())
+    s2 = copy(s1)
+    list(islice(s1, 100))
+    assert all(v() is not None for v in values)
+    list(islice(s2, 50))
+    gc.collect()
+    assert all(v() is None for v in values[:49])
+    assert all(v() is not None for v in values[50:])
+
+
 def test_diff2():
     h0, x = 1.0, 0.3
     d = diff2(h0, f, x)
@@ -46,3 +94,100 @@ def test_diff3():
     h0, x = 1.0, 0.3
     d = diff3(h0, f, x)
     assert d == pytest.approx(cos(x))
+
+
+def test_richardson():
+    failed = 0
+    for x in [0.3, 1.0, 1.5, 2.0, 2.7]:
+        for n in range(1, 14):
+            (d1, d2) = (differentiate(1.0, f, x), differentiate(1.0, f, x))
+            seq2 = list(islice(richardson(d2), n))
+            assert len(seq2) == n
+            try:
+                seq1 = list(islice(super_improve(d1), n))
+            except (ValueError, ZeroDivisionError):
+                failed = failed + 1
+                continue
+            assert seq1 == seq2
+            # the same number of values are consumed
+            assert next(d1) == next(d2)
+    assert failed > 0
+
+    # with known orders, nothing is estimated
+    def no_order(itr):
+        raise AssertionError
+
+    d = within(
+        esp, richardson(differentiate(1.0, f, 0.3), no_order, orders=count(1)))
+    assert next(d) == pytest.approx(cos(0.3))
+
+
+def test_diff_batch():
+    x = np.linspace(-3.0, 3.0, 101)
+    for (d, d_batch) in [(diff1, diff1_batch), (diff2, diff2_batch),
+                         (diff3, diff3_batch)]:
+        points = []
+
+        def f_batch(x):
+            points.append(x.size)
+            return np.sin(x)
+
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return sin(x)
+
+        res = d_batch(1.0, f_batch, x)
+        for (xi, r) in zip(x, res):
+            try:
+                assert r == d(1.0, f, xi)
+                assert r == pytest.approx(cos(xi), abs=1e-5)
+            except (ValueError, ZeroDivisionError):
+                # the order can't be estimated at this point
+                assert isnan(r)
+        assert sum(points) < len(calls)
+        # f(x) is evaluated once, for all points
+        assert points[0] == x.size
+
+    # the shape of x is kept
+    res = diff3_batch(1.0, np.sin, np.linspace(0.0, 0.5, 10).reshape((-1, 1)))
+    assert res == pytest.approx(
+        np.cos(np.linspace(0.0, 0.5, 10)).reshape((-1, 1)))
+
+
+def test_diff_limited():
+    for (d, transform) in [(diff1, lambda itr: itr), (diff2, improve),
+                           (diff3, richardson)]:
+        (v, status, _) = within_limited(esp,
+                                        transform(differentiate(1.0, f, 0.3)))
+        assert (v, status) == (d(1.0, f, 0.3), 'converged')
+
+    def noisy(x):
+        return sin(x) + 1e-12 * random.Random(x).random()
+
+    for x in [0.3, 1.0, 2.0]:
+        assert diff1(1.0, noisy, x) == 0.0
+        for transform in [lambda itr: itr, improve]:
+            (d, status,
+             i) = within_limited(esp, transform(differentiate(1.0, noisy, x)))
+            assert status == 'stalled'
+            assert i < 40
+            assert d == pytest.approx(cos(x), abs=1e-6)
+
+
+def test_diff_limited_wrappers():
+    for (d, d_limited) in [(diff1, diff1_limited), (diff2, diff2_limited),
+                           (diff3, diff3_limited)]:
+        (v, status, _) = d_limited(1.0, f, 0.3)
+        assert (v, status) == (d(1.0, f, 0.3), 'converged')
+        assert d_limited(1.0, f, 0.3,
+                         max_iterations=2).status == 'max_iterations'
+
+    def noisy(x):
+        return sin(x) + 1e-12 * random.Random(x).random()
+
+    for d_limited in [diff1_limited, diff2_limited]:
+        (d, status, _) = d_limited(1.0, noisy, 1.0)
+        assert status == 'stalled'
+        assert d == pytest.approx(cos(1.0), abs=1e-6)
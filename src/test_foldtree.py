@@ -1,4 +1,5 @@
 from foldtree import *
+import operator
 
 my_tree2 = Node(1, [
     Node(2, [
@@ -53,3 +54,29 @@ def test_tree_depth():
     assert tree_depth(my_tree) == 3
 
     assert tree_depth(my_tree2) == 5
+
+
+def test_foldtree_index():
+    for t in [Node(1, []), my_tree, my_tree2]:
+        assert sumtree(t, fold=foldtree_index) == sumtree(t)
+        assert tree_labels(t, fold=foldtree_index) == tree_labels(t)
+        assert tree_size(t, fold=foldtree_index) == tree_size(t)
+        assert tree_depth(t, fold=foldtree_index) == tree_depth(t)
+
+        res = maptree(lambda x: -1 * x, t, fold=foldtree_index)
+        assert res == maptree(lambda x: -1 * x, t)
+
+    assert foldtree_index(operator.add, operator.add, 0, []) == 0
+
+
+def test_foldtree_index_wide_tree():
+    n = 100000
+    t = Node(0, [Node(i, [Node(i, [])]) for i in range(n)])
+
+    assert sumtree(t, fold=foldtree_index) == n * (n - 1)
+    assert tree_size(t, fold=foldtree_index) == 2 * n + 1
+    assert tree_depth(t, fold=foldtree_index) == 3
+    assert len(tree_labels(t, fold=foldtree_index)) == 2 * n + 1
+
+    res = maptree(lambda x: x + 1, t, fold=foldtree_index)
+    assert sumtree(res, fold=foldtree_index) == n * (n - 1) + 2 * n + 1
@@ -1,6 +1,9 @@
-from math import sin, pi
+from math import sin, pi, exp, atan, log
+from itertools import islice
+import numpy as np
 import pytest
 from integrate import *
+from lazy_utils import within_limited
 
 
 def f(x):
@@ -23,3 +26,135 @@ def test_integrate3():
     a, b = 0.0, pi
     d = integrate3(f, a, b)
     assert d == pytest.approx(2.0)
+
+
+def test_trapezoids():
+    seq1 = list(islice(integ(f, 0.0, pi, f(0.0), f(pi)), 12))
+    seq2 = list(islice(trapezoids(np.sin, 0.0, pi), 12))
+    assert seq2 == pytest.approx(seq1, rel=1e-12, abs=1e-15)
+
+    points = []
+
+    def g(x):
+        points.append(x.size)
+        return np.exp(x)
+
+    assert integrate3_array(g, 0.0,
+                            1.0) == pytest.approx(integrate3(exp, 0.0, 1.0),
+                                                  rel=1e-12)
+    # f is evaluated once per level
+    assert points == [2] + [2**k for k in range(len(points) - 1)]
+
+    assert integrate2_array(np.sin, 0.0, pi) == pytest.approx(2.0)
+    assert integrate3_array(np.sin, 0.0,
+                            pi) == pytest.approx(integrate3(f, 0.0, pi),
+                                                 rel=1e-12)
+
+
+def test_integrate4():
+    calls3 = []
+
+    def f3(x):
+        calls3.append(x)
+        return exp(x)
+
+    calls4 = []
+
+    def f4(x):
+        calls4.append(x)
+        return exp(x)
+
+    assert integrate4(f4, 0.0, 1.0) == pytest.approx(exp(1.0) - 1.0, rel=1e-12)
+    assert integrate3(f3, 0.0, 1.0) == pytest.approx(exp(1.0) - 1.0)
+    assert len(calls4) < len(calls3)
+    assert integrate4_array(np.exp, 0.0, 1.0) == pytest.approx(exp(1.0) - 1.0,
+                                                               rel=1e-12)
+    assert integrate4(f, 0.0, pi) == pytest.approx(2.0)
+
+    # the orders of these can't be estimated from the first values
+    cases = [(lambda x: x**4, 0.0, 1.0, 0.2), (np.sqrt, 1.0, 4.0, 14.0 / 3.0),
+             (lambda x: 1.0 / (1.0 + x * x), 0.0, 3.0, atan(3.0)),
+             (lambda x: 1.0 / x, 1.0, 10.0, log(10.0))]
+    for (g, a, b, expected) in cases:
+        assert integrate4(g, a, b) == pytest.approx(expected, rel=1e-10)
+        assert integrate4_array(g, a, b) == pytest.approx(expected, rel=1e-10)
+        # estimating the orders doesn't fail, but it's slower
+        d = within(esp, richardson(integ(g, a, b, g(a), g(b))))
+        assert next(d) == pytest.approx(expected, rel=1e-8)
+
+
+def test_integrate_adaptive():
+    q = integrate_adaptive(f, 0.0, pi)
+    assert q.value == pytest.approx(2.0)
+    assert q.error <= esp
+
+    # a peak at 0.3
+    calls = []
+
+    def peak(x):
+        calls.append(x)
+        return exp(-200.0 * abs(x - 0.3))
+
+    exact = (2.0 - exp(-140.0) - exp(-60.0)) / 200.0
+
+    q = integrate_adaptive(peak, 0.0, 1.0, tol=1e-8)
+    assert q.value == pytest.approx(exact, abs=1e-8)
+    assert q.evaluations == len(calls)
+
+    # halving all the intervals needs many more evaluations to be as accurate
+    calls.clear()
+    for v in integ(peak, 0.0, 1.0, peak(0.0), peak(1.0)):
+        if abs(v - exact) <= abs(q.value - exact):
+            break
+    assert q.evaluations * 10 < len(calls)
+
+    # stop early
+    calls.clear()
+    q = integrate_adaptive(peak, 0.0, 1.0, tol=1e-8, max_evaluations=50)
+    assert q.evaluations == len(calls) <= 50
+    assert q.error > 1e-8
+
+
+def test_integrate_limited():
+    for (integrate, transform) in [(integrate3, improve),
+                                   (integrate4, romberg)]:
+        (v, status,
+         _) = within_limited(esp, transform(integ(sin, 0.0, pi, 0.0, sin(pi))))
+        assert (v, status) == (integrate(sin, 0.0, pi), 'converged')
+
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        return sin(1.0 / x)
+
+    (v, status, i) = within_limited(esp,
+                                    integ(f, 0.01, 1.0, f(0.01), f(1.0)),
+                                    max_iterations=12)
+    assert (status, i) == ('max_iterations', 12)
+    assert len(calls) == 2**11 + 1
+    assert v == pytest.approx(integrate_adaptive(f, 0.01, 1.0).value, abs=1e-3)
+
+    (v, status, i) = within_limited(esp,
+                                    integ(f, 0.01, 1.0, f(0.01), f(1.0)),
+                                    max_iterations=None,
+                                    timeout=0.05)
+    assert status == 'timeout'
+
+
+def test_integrate_limited_wrappers():
+    for (integrate, integrate_limited) in [(integrate2, integrate2_limited),
+                                           (integrate3, integrate3_limited),
+                                           (integrate4, integrate4_limited)]:
+        (v, status, _) = integrate_limited(sin, 0.0, pi)
+        assert (v, status) == (integrate(sin, 0.0, pi), 'converged')
+
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        return sin(1.0 / x)
+
+    (v, status, i) = integrate2_limited(f, 0.01, 1.0, max_iterations=12)
+    assert (status, i) == ('max_iterations', 12)
+    assert len(calls) == 2**11 + 1
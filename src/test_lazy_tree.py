@@ -1,4 +1,5 @@
 from lazy_utils import *
+import operator
 import pytest
 
 
@@ -116,3 +117,68 @@ def test_tree_depth():
 
     t = mk_test_tree2()
     assert tree_depth(t) == 5
+
+
+def test_foldtree_stack():
+    t = mk_tree_(1, None)
+    assert sumtree(t, fold=foldtree_stack) == 1
+    assert foldtree_stack(operator.add, operator.add, 0, None) == 0
+
+    for fold in [foldtree, foldtree_stack]:
+        assert sumtree(mk_test_tree2(), fold=fold) == sum(range(1, 12))
+        assert tree_size(mk_test_tree2(), fold=fold) == 11
+        assert tree_depth(mk_test_tree2(), fold=fold) == 5
+
+        res = maptree(lambda x: -1 * x, mk_test_tree2(), fold=fold)
+        assert list(tree_labels(res)) == [-1 * i for i in range(1, 12)]
+
+    # an iterator of subtrees, rather than a tree
+    t = iter([mk_test_tree(), mk_test_tree2()])
+    assert foldtree_stack(operator.add, operator.add, 0, t) == 10 + 66
+
+
+def test_foldtree_stack_wide_tree():
+    n = 10000
+
+    def mk_wide_tree():
+        return mk_tree_(0,
+                        [mk_tree_(i, [mk_tree_(i, None)]) for i in range(n)])
+
+    assert sumtree(mk_wide_tree(), fold=foldtree_stack) == n * (n - 1)
+    assert tree_size(mk_wide_tree(), fold=foldtree_stack) == 2 * n + 1
+    assert tree_depth(mk_wide_tree(), fold=foldtree_stack) == 3
+
+    res = maptree(lambda x: x + 1, mk_wide_tree(), fold=foldtree_stack)
+    assert sumtree(res, fold=foldtree_stack) == n * (n - 1) + 2 * n + 1
+
+
+def test_foldtree_stack_deep_tree():
+    n = 10000
+
+    def mk_deep_tree():
+        t = mk_tree_(n - 1, None)
+        for i in reversed(range(n - 1)):
+            t = mk_tree_(i, [t])
+        return t
+
+    assert sumtree(mk_deep_tree(), fold=foldtree_stack) == sum(range(n))
+    assert tree_size(mk_deep_tree(), fold=foldtree_stack) == n
+    assert tree_depth(mk_deep_tree(), fold=foldtree_stack) == n
+
+    res = maptree(lambda x: x + 1, mk_deep_tree(), fold=foldtree_stack)
+    assert sumtree(res, fold=foldtree_stack) == sum(range(1, n + 1))
+
+
+def test_maptree_batched():
+
+    def f_batch(labels):
+        assert len(labels) <= 3
+        return [-1 * n for n in labels]
+
+    t = maptree_batched(f_batch, mk_tree_(10, None), batch_size=3)
+    assert t == Node(-10, None)
+
+    t = maptree_batched(f_batch, mk_test_tree2(), batch_size=3)
+    assert list(tree_labels(t)) == [-1 * i for i in range(1, 12)]
+    assert tree_depth(maptree_batched(f_batch, mk_test_tree2(),
+                                      batch_size=3)) == 5
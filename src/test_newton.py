@@ -1,6 +1,11 @@
 import math
+import random
 import pytest
+import numpy as np
+from decimal import Decimal, InvalidOperation, localcontext
+from itertools import accumulate, count, islice
 from newton import *
+from diff import diff3
 
 
 def test_newton_sqrt_():
@@ -19,3 +24,291 @@ def test_newton_sqrt():
 def test_newton_sqrt_relative():
     res = newton_sqrt_relative(10.0, 2.0)
     assert res == pytest.approx(math.sqrt(10.0))
+
+
+def test_limited():
+    assert within_limited(0.00001,
+                          newton_sqrt_(10.0, 2.0)) == (newton_sqrt(10.0, 2.0),
+                                                       'converged', 6)
+    assert relative_limited(0.00001, newton_sqrt_(
+        10.0, 2.0)).value == newton_sqrt_relative(10.0, 2.0)
+
+    # no square root. The deltas are always larger than 1.
+    (x, status, i) = within_limited(0.00001, newton_sqrt_(-1.0, 2.0))
+    assert (status, i) == ('stalled', 23)
+    (x, status, i) = within_limited(0.00001,
+                                    newton_sqrt_(-1.0, 2.0),
+                                    patience=None)
+    assert (status, i) == ('max_iterations', 1000)
+    (x, status, i) = within_limited(0.00001,
+                                    newton_sqrt_(-1.0, 2.0),
+                                    max_iterations=None,
+                                    timeout=0.01,
+                                    patience=None)
+    assert status == 'timeout'
+
+    # sqrt(0.0) approaches 0. relative doesn't stop, but it doesn't divide by 0
+    assert relative_limited(0.00001, newton_sqrt_(0.0,
+                                                  2.0)).status == 'stalled'
+    assert relative_limited(0.00001, iter([2.0, 1.0, 0.0,
+                                           0.0])) == (0.0, 'converged', 4)
+
+    assert within_limited(0.1, iter([1.0, 2.0, 2.5])) == (2.5, 'exhausted', 3)
+    assert within_limited(0.1, iter([1.0, 2.0,
+                                     math.nan])) == (2.0, 'diverged', 3)
+
+    # the deltas grow every time
+    def double(x: float) -> float:
+        return 2.0 * x
+
+    assert within_limited(0.1, repeat_f(double, 1.0)) == (2.0, 'diverged', 12)
+    assert within_limited(0.1, repeat_f(double, 1.0),
+                          patience=20).status == 'diverged'
+    assert within_limited(0.1, repeat_f(double, 1.0),
+                          patience=None).status == 'max_iterations'
+
+
+def test_newton_sqrt_limited():
+    assert newton_sqrt_limited(10.0, 2.0) == (newton_sqrt(10.0,
+                                                          2.0), 'converged', 6)
+    assert newton_sqrt_limited(-1.0,
+                               2.0) == within_limited(0.00001,
+                                                      newton_sqrt_(-1.0, 2.0))
+    assert newton_sqrt_limited(-1.0, 2.0,
+                               max_iterations=5).status == 'max_iterations'
+    assert newton_sqrt_limited(-1.0,
+                               2.0,
+                               max_iterations=None,
+                               timeout=0.01,
+                               patience=None).status == 'timeout'
+
+
+def test_newton_sqrt_array():
+    n = np.concatenate(
+        [np.linspace(0.001, 10.0, 101),
+         np.geomspace(10.0, 1e12, 50)])
+
+    for (sqrt, sqrt_array) in [(newton_sqrt, newton_sqrt_array),
+                               (newton_sqrt_relative,
+                                newton_sqrt_relative_array)]:
+        (res, iterations) = sqrt_array(n, 2.0)
+        for (x, r, i) in zip(n, res, iterations):
+            assert r == sqrt(x, 2.0)
+            # r is the i-th approximation
+            assert r == list(islice(newton_sqrt_(x, 2.0), i + 1))[-1]
+        assert res == pytest.approx(np.sqrt(n))
+
+    # the shape of n is kept, and a can be an array
+    n = np.array([[4.0, 9.0], [16.0, 25.0]])
+    (res, iterations) = newton_sqrt_array(n, n)
+    assert res.shape == iterations.shape == (2, 2)
+    assert res == pytest.approx(np.sqrt(n))
+
+    # 0 is fine with within, but not with relative: the approximations
+    # are halved until they are 0, and then 0/0 is nan. The other
+    # elements are not affected.
+    n = np.array([0.0, 4.0, 9.0])
+    (res, iterations) = newton_sqrt_array(n, 1.0)
+    assert res == pytest.approx([0.0, 2.0, 3.0], abs=1e-5)
+    (res, iterations) = newton_sqrt_relative_array(n, 1.0)
+    assert math.isnan(res[0])
+    assert list(res[1:]) == [
+        newton_sqrt_relative(4.0, 1.0),
+        newton_sqrt_relative(9.0, 1.0)
+    ]
+    (res, iterations) = newton_sqrt_array(n, np.array([0.0, 0.0, 1.0]))
+    assert math.isnan(res[0]) and math.isinf(res[1])
+    assert list(iterations[:2]) == [1, 1]
+    assert res[2] == newton_sqrt(9.0, 1.0)
+
+    # a negative element has no square root, and doesn't hold up the others
+    n = np.array([4.0, -1.0, 9.0])
+    for (sqrt, sqrt_array) in [(newton_sqrt, newton_sqrt_array),
+                               (newton_sqrt_relative,
+                                newton_sqrt_relative_array)]:
+        (res, iterations) = sqrt_array(n, 2.0)
+        assert math.isnan(res[1]) and iterations[1] == 1
+        assert list(res[[0, 2]]) == [sqrt(4.0, 2.0), sqrt(9.0, 2.0)]
+
+    # the updates stop after max_iterations
+    (res, iterations) = repeat_array(next_sqrt_approx,
+                                     within_array(0.00001),
+                                     np.array([4.0, -1.0]),
+                                     2.0,
+                                     max_iterations=50)
+    assert iterations[0] < 50 and iterations[1] == 50
+    assert res[0] == newton_sqrt(4.0, 2.0)
+
+
+def test_newton_isqrt():
+    rng = random.Random(0)
+    ns = list(range(1000)) + [
+        rng.getrandbits(rng.randint(1, 5000)) for _ in range(500)
+    ]
+    # the last 600 bits don't change the first approximations
+    ns = ns + [(2**1000 + 2**600)**2 + d for d in [-1, 0, 1]]
+    for n in ns:
+        assert newton_isqrt(n) == math.isqrt(n)
+    with pytest.raises(ValueError):
+        newton_isqrt(-1)
+
+
+def test_newton_sqrt_decimal():
+    rng = random.Random(0)
+    for _ in range(2000):
+        prec = rng.randint(1, 40)
+        root = Decimal(rng.randint(1, 10**prec))
+        with localcontext() as ctx:
+            ctx.prec = 100
+            n = Decimal(rng.randint(1, 10**rng.randint(1, 60))).scaleb(
+                rng.randint(-50, 50))
+            # an exact square, and a square root exactly half way between
+            # two numbers with prec digits
+            ns = [n, root**2, (root + Decimal('0.5'))**2]
+        with localcontext() as ctx:
+            ctx.prec = prec
+            for m in ns:
+                # the same digits and exponent
+                assert str(newton_sqrt_decimal(m)) == str(m.sqrt())
+                assert len(newton_sqrt_decimal(m).as_tuple().digits) <= prec
+
+    with localcontext() as ctx:
+        ctx.prec = 2000
+        for n in [Decimal(2), Decimal('1e-1001'), Decimal('0.99')]:
+            assert newton_sqrt_decimal(n) == n.sqrt()
+    assert newton_sqrt_decimal(
+        Decimal(2),
+        50) == Decimal('1.4142135623730950488016887242096980785696718753769')
+
+    for n in [
+            '4', '4.00', '400', '4E+2', '0.0400', '1E-1001', 'Infinity', '0',
+            '-0', '0E-3', '0E+5', 'NaN'
+    ]:
+        assert str(newton_sqrt_decimal(Decimal(n))) == str(Decimal(n).sqrt())
+    for n in ['-1', '-Infinity']:
+        with pytest.raises(ValueError):
+            newton_sqrt_decimal(Decimal(n))
+    with pytest.raises(InvalidOperation):
+        newton_sqrt_decimal(Decimal('sNaN'))
+
+
+def test_accelerators():
+    # a geometric error is eliminated by aitken, and 2 of them by wynn
+    assert list(
+        islice(aitken(repeat_f(lambda x: 1.0 + (x - 1.0) / 2.0, 2.0)),
+               3)) == [1.0, 1.0, 1.0]
+    seq = (1.0 + 0.5**n + 0.25**n for n in count(0))
+    assert list(islice(wynn(seq, 2), 4, 6)) == pytest.approx([1.0, 1.0],
+                                                             abs=1e-12)
+    # order 1 is aitken
+    seq1 = list(islice(aitken(repeat_f(math.cos, 1.0)), 10))
+    seq2 = list(islice(wynn(repeat_f(math.cos, 1.0), 1), 2, 12))
+    assert seq1 == pytest.approx(seq2, rel=1e-12)
+
+    def calls(accelerate, seq, esp):
+        xs = []
+        x = next(within(esp, accelerate(seq(xs.append))))
+        return (len(xs), x)
+
+    def fixed_point(count_call):
+
+        def f(x):
+            count_call(x)
+            return math.cos(x)
+
+        return repeat_f(f, 1.0)
+
+    def series(term, start):
+
+        def seq(count_call):
+
+            def f(n):
+                count_call(n)
+                return term(n)
+
+            return accumulate(map(f, count(start)))
+
+        return seq
+
+    x0 = 0.7390851332151607
+    (n0, _) = calls(lambda itr: itr, fixed_point, 1e-10)
+    for (accelerate, fewer) in [(aitken, 2), (wynn, 3), (levin, 1.5)]:
+        (n, x) = calls(accelerate, fixed_point, 1e-10)
+        assert n < n0 / fewer
+        assert x == pytest.approx(x0, abs=1e-9)
+
+    alternating = series(lambda n: (-1)**n / (2 * n + 1), 0)
+    for (accelerate, most) in [(aitken, 2000), (wynn, 30), (levin, 12)]:
+        (n, x) = calls(accelerate, alternating, 1e-10)
+        assert n <= most
+        assert x == pytest.approx(math.pi / 4, abs=1e-9)
+
+    (n, x) = calls(levin, series(lambda n: 1 / n**2, 1), 1e-8)
+    assert n <= 12
+    assert x == pytest.approx(math.pi**2 / 6, abs=1e-8)
+
+    # nothing breaks when the sequence has converged
+    for accelerate in [aitken, wynn, levin]:
+        x = next(within(0.0, accelerate(newton_sqrt_(10.0, 2.0))))
+        assert x == pytest.approx(math.sqrt(10.0))
+
+
+def test_newton_root():
+
+    def f(x):
+        return x**3 - 2.0 * x - 5.0
+
+    def df(x):
+        return 3.0 * x**2 - 2.0
+
+    x0 = 2.0945514815423265
+
+    # one evaluation of f and df in each step
+    r = find_root(f, 2.0, df, esp=1e-12)
+    assert r.x == pytest.approx(x0, abs=1e-12)
+    assert (r.evaluations, r.derivatives) == (r.iterations + 1, r.iterations)
+    assert list(islice(newton_root(f, 2.0, df), 6))[-1] == r.x
+
+    # reusing the approximated derivative saves evaluations
+    r1 = find_root(f, 2.0, esp=1e-12)
+    r3 = find_root(f, 2.0, reuse=3, esp=1e-12)
+    assert r1.x == pytest.approx(x0, abs=1e-12)
+    assert r3.x == pytest.approx(x0, abs=1e-12)
+    assert r3.derivatives < r1.derivatives
+    assert r3.evaluations < r1.evaluations
+    r = find_root(lambda x: math.cos(x) - x,
+                  1.0,
+                  derivative=diff3,
+                  stop=relative)
+    assert r.x == pytest.approx(0.7390851332151607)
+
+    # bisect when Newton's method leaves the bracket
+    def datan(x):
+        return 1.0 / (1.0 + x**2)
+
+    assert abs(list(islice(newton_root(math.atan, 2.0, datan), 5))[-1]) > 1e5
+    for (df_, reuse) in [(datan, 1), (datan, 3), (None, 1), (None, 3)]:
+        r = find_root(math.atan,
+                      2.0,
+                      df_,
+                      reuse,
+                      bracket=(-1.0, 3.0),
+                      esp=1e-12)
+        assert r.x == pytest.approx(0.0, abs=1e-12)
+    with pytest.raises(ValueError):
+        next(newton_root(math.atan, 2.0, bracket=(1.0, 3.0)))
+
+    # the derivative of x^2 - 1 is 0 at 0. Without a bracket, there's no
+    # next step, and with a bracket, the next step is a bisection
+    def g(x):
+        return x * x - 1.0
+
+    def dg(x):
+        return 2.0 * x
+
+    with pytest.raises(ZeroDivisionError):
+        find_root(g, 0.0, dg)
+    with pytest.raises(ZeroDivisionError):
+        find_root(g, 0.0)
+    r = find_root(g, 0.0, dg, bracket=(0.0, 3.0), esp=1e-12)
+    assert r.x == pytest.approx(1.0, abs=1e-12)
@@ -1,9 +1,26 @@
 from tic_tac_toe import init_board, moves, static_eval, display_board
 from tic_tac_toe import who_plays, posinf, neginf, gametree, prune, won
+from tic_tac_toe import evaluate_iterative, evaluate_parallel, search_pool
+from tic_tac_toe import max_depth
 from tic_tac_toe import static_eval_state
-from tic_tac_toe import evaluate0, evaluate1, evaluate2
+from tic_tac_toe import evaluate0, evaluate1, evaluate2, evaluate3
+from tic_tac_toe import to_bitboard, from_bitboard
+from tic_tac_toe import who_plays_bits, won_bits, moves_bits
+from tic_tac_toe import gametree_bits, static_eval_bits, static_eval_0_bits
+from tic_tac_toe import static_eval_0, lookup_static_eval_0, get_eval_table
+from tic_tac_toe import board_index, index_board, num_boards
+from tic_tac_toe import static_eval_0_batch, static_eval_batch
+from tic_tac_toe import transform, symmetries, canonical_index
+from tic_tac_toe import evaluate0_bits, evaluate1_bits, evaluate2_bits
+from tic_tac_toe import Player, play_game, self_play
+from tic_tac_toe import build_book, lookup_book, computer_next_move, num_pos
+from tic_tac_toe import player_next_move
 from lazy_utils import tree_size, tree_depth, maptree, tree_labels
+from game import TranspositionTable, SearchStats
+import game
+import tic_tac_toe
 import pytest
+import random
 
 
 def test_who_plays():
@@ -66,6 +83,41 @@ def test_static_eval_winning_condition():
     assert eval_1(b) == posinf
 
 
+def test_eval_table(tmp_path, monkeypatch):
+    b = [1, 0, 0, None, 0, None, 1, None, None]
+    assert index_board(board_index(b)) == b
+    assert board_index(init_board()) == 0
+
+    for idx in range(0, num_boards, 97):
+        b = index_board(idx)
+        assert lookup_static_eval_0(b) == static_eval_0(b)
+
+    # build the table and cache it in a file, and then read it back
+    path = str(tmp_path / "eval_table.bin")
+    monkeypatch.setattr(tic_tac_toe, "eval_table_path", path)
+    monkeypatch.setattr(tic_tac_toe, "eval_table", None)
+    table = get_eval_table()
+    monkeypatch.setattr(tic_tac_toe, "eval_table", None)
+    assert get_eval_table() == table
+
+
+def test_static_eval_batch():
+    boards = [index_board(idx) for idx in range(num_boards)]
+    assert static_eval_0_batch(boards).tolist() == [
+        static_eval_0(b) for b in boards
+    ]
+
+    b = [1, 0, 0, None, 0, None, 1, None, None]
+    assert static_eval_batch(1)([b]) == [static_eval(1)(b)]
+
+    b = [1, 0, None, None, 0, None, None, None, None]
+    assert evaluate0(1, batch=True)(b) == evaluate0(1)(b)
+    for evaluate in [evaluate1, evaluate2]:
+        best_move = evaluate(1, batch=True)(b)
+        assert best_move.board == [1, 0, None, None, 0, None, None, 1, None]
+        assert best_move.score == evaluate(1)(b).score
+
+
 def test_gametree_evaluation():
     # player 0 has won
     b = [1, 0, 0, 1, 0, None, None, 0, 1]
@@ -136,3 +188,349 @@ def test_tree_eval2():
     b = [0, 1, None, None, 0, None, 0, None, 1]
     best_move = evaluate2(player=1)(b)
     assert best_move.score == neginf
+
+
+def test_tree_eval3():
+    boards = [
+        init_board(), [1, 0, 0, None, 0, None, 1, None, None],
+        [1, 0, None, None, 0, None, None, None, None],
+        [0, 1, None, None, 0, None, None, None, 1],
+        [0, 1, None, None, 0, None, 0, None, 1], [1, 0, 1, 0, 0, 1, 0, 1, 0]
+    ]
+
+    for b in boards:
+        player = who_plays(b)
+        expected = evaluate2(player)(b)
+        best_move = evaluate3(player)(b)
+        assert best_move.board == expected.board
+        assert best_move.score == expected.score
+
+
+def test_evaluate_parallel():
+    boards = [
+        init_board(), [1, 0, 0, None, 0, None, 1, None, None],
+        [1, 0, None, None, 0, None, None, None, None],
+        [0, 1, None, None, 0, None, 0, None, 1], [1, 0, 1, 0, 0, 1, 0, 1, 0]
+    ]
+
+    for b in boards:
+        player = who_plays(b)
+        expected = evaluate3(player)(b)
+        best_move = evaluate_parallel(player, workers=2)(b)
+        assert best_move.board == expected.board
+        assert best_move.score == expected.score
+
+    # the processes of a pool are reused for all the searches
+    for player in [0, 1]:
+        with search_pool(player, workers=2) as pool:
+            search = evaluate_parallel(player, pool=pool)
+            for b in boards:
+                if who_plays(b) == player:
+                    assert search(b).board == evaluate3(player)(b).board
+            pids = {p.pid for p in pool.executor._processes.values()}
+            search(init_board())
+            assert {p.pid for p in pool.executor._processes.values()} == pids
+
+
+def test_evaluate_parallel_spawn():
+    # the workers make the search functions themselves, so nothing
+    # has to be inherited from the parent process
+    boards = [[1, 0, None, None, 0, None, None, None, None],
+              [0, 1, None, None, 0, None, 0, None, 1]]
+    for player in [0, 1]:
+        with search_pool(player, workers=2, start_method='spawn') as pool:
+            search = evaluate_parallel(player, pool=pool)
+            for b in boards:
+                if who_plays(b) == player:
+                    expected = evaluate3(player)(b)
+                    best_move = search(b)
+                    assert best_move.board == expected.board
+                    assert best_move.score == expected.score
+
+    b = [1, 0, None, None, 0, None, None, None, None]
+    assert evaluate_parallel(
+        1, workers=2, start_method='spawn')(b).board == evaluate3(1)(b).board
+
+
+def test_evaluate_parallel_shuffled(monkeypatch):
+    # the moves are shuffled differently every time the tree is built,
+    # so the scores have to be matched with the moves by their boards
+    monkeypatch.setattr(tic_tac_toe, "shuffle_moves", True)
+    b = [1, 0, None, None, 0, None, None, None, None]
+    with search_pool(1, workers=2) as pool:
+        for seed in range(10):
+            random.seed(seed)
+            best_move = evaluate_parallel(1, pool=pool)(b)
+            expected = evaluate2(1)(b)
+            assert best_move.board == expected.board
+            assert best_move.score == expected.score
+
+
+def test_transposition_table():
+    boards = [
+        init_board(), [1, 0, 0, None, 0, None, 1, None, None],
+        [1, 0, None, None, 0, None, None, None, None],
+        [0, 1, None, None, 0, None, None, None, 1],
+        [0, 1, None, None, 0, None, 0, None, 1]
+    ]
+
+    for b in boards:
+        player = who_plays(b)
+        for (evaluate, replace) in [(evaluate1, 'lru'), (evaluate2, 'lru'),
+                                    (evaluate2, 'depth')]:
+            table = TranspositionTable(max_entries=1000, replace=replace)
+            expected = evaluate(player)(b)
+            best_move = evaluate(player, table)(b)
+            assert best_move.board == expected.board
+            assert best_move.score == expected.score
+            assert len(table) <= 1000
+
+    # the table scores the leaves one by one, so batches can't be used
+    for evaluate in [evaluate1, evaluate2]:
+        with pytest.raises(ValueError):
+            evaluate(0, TranspositionTable(), batch=True)
+
+
+def test_transposition_table_nodes():
+    n_moves = 0
+
+    def counting_moves(board):
+        nonlocal n_moves
+        n_moves = n_moves + 1
+        return moves(board)
+
+    counting_gametree = game.gametree(counting_moves)
+    eval_func = static_eval_state(0)
+
+    game.evaluate2(counting_gametree, eval_func, prune)(init_board())
+    n_without_table = n_moves
+
+    n_moves = 0
+    table = TranspositionTable()
+    game.evaluate2(counting_gametree, eval_func, prune, table)(init_board())
+    assert n_moves < n_without_table / 10
+    assert table.hits > 0 and table.misses > 0
+
+
+def test_symmetries():
+    b = [1, 0, 0, None, 0, None, 1, None, None]
+    assert len(set(board_index(transform(b, perm))
+                   for perm in symmetries)) == 8
+    for perm in symmetries:
+        assert canonical_index(transform(b, perm)) == canonical_index(b)
+        assert static_eval_0(transform(b, perm)) == static_eval_0(b)
+
+
+def test_reduce_symmetry(monkeypatch):
+    boards = [[1, 0, None, None, 0, None, None, None, None],
+              [0, 1, None, None, 0, None, None, None, 1],
+              [0, 1, None, None, 0, None, 0, None, 1]]
+    expected = [evaluate2(who_plays(b))(b) for b in boards]
+    n = tree_size(prune(gametree(init_board())))
+
+    monkeypatch.setattr(tic_tac_toe, "reduce_symmetry", True)
+    assert len(list(moves(init_board()))) == 3
+    assert tree_size(prune(gametree(init_board()))) < n / 4
+
+    for (b, e) in zip(boards, expected):
+        best_move = evaluate2(who_plays(b))(b)
+        assert best_move.board == e.board
+        assert best_move.score == e.score
+
+
+def test_evaluate_iterative():
+    boards = [
+        init_board(), [1, 0, None, None, 0, None, None, None, None],
+        [0, 1, None, None, 0, None, None, None, 1],
+        [0, 1, None, None, 0, None, 0, None, 1]
+    ]
+
+    for b in boards:
+        player = who_plays(b)
+        search = game.evaluate_iterative(gametree, static_eval_state(player),
+                                         max_depth)
+        results = list(search(b))
+        assert len(results) <= max_depth
+        assert results[-1].score == evaluate2(player)(b).score
+
+    # player 1 should block player 0's winning move, even with a tiny budget
+    b = [1, 0, None, None, 0, None, None, None, None]
+    best_move = evaluate_iterative(player=1, time_limit=None, node_limit=50)(b)
+    assert best_move.board == [1, 0, None, None, 0, None, None, 1, None]
+
+    # the whole game tree is searched, so the results stop coming
+    results = list(
+        game.evaluate_iterative(gametree, static_eval_state(0))(init_board()))
+    assert len(results) == 9
+    assert results[-1].score == 0
+
+    # ties are broken like evaluate2, however the moves were sorted
+    for b1 in moves(init_board()):
+        for b2 in moves(b1):
+            player = who_plays(b2)
+            results = list(
+                game.evaluate_iterative(gametree, static_eval_state(player),
+                                        max_depth)(b2))
+            assert results[-1].board == evaluate2(player)(b2).board
+
+
+def test_search_stats():
+    b = [1, 0, None, None, 0, None, None, None, None]
+    n = tree_size(prune(gametree(b)))
+    stats = SearchStats()
+
+    # minimax searches the whole tree
+    assert evaluate1(1, stats=stats)(b).board == evaluate1(1)(b).board
+    report = stats.reports[-1]
+    assert report.nodes[0] == 1
+    assert report.visited == n
+    assert report.evaluations == n
+    assert report.cutoffs == 0
+    assert report.visited == 1 + report.branching * sum(report.nodes)
+    assert report.time_moves > 0 and report.time_eval > 0
+    assert report.time_search > 0
+
+    for evaluate in [
+            evaluate2(1, stats=stats),
+            evaluate2(1, TranspositionTable(), stats=stats),
+            evaluate3(1, stats=stats)
+    ]:
+        assert evaluate(b).board == evaluate2(1)(b).board
+        report = stats.reports[-1]
+        assert report.cutoffs > 0
+        assert report.visited < n
+        assert report.leaves <= report.visited - sum(report.nodes)
+
+    # only the leaves are scored by evaluate3
+    assert report.evaluations == report.leaves
+    assert len(stats.reports) == 4
+
+
+def test_bitboard(monkeypatch):
+    b = [1, 0, 0, None, 0, None, 1, None, None]
+    assert to_bitboard(b) == (0b000010110, 0b001000001)
+    assert from_bitboard(to_bitboard(b)) == b
+    assert who_plays_bits(to_bitboard(b)) == who_plays(b)
+
+    boards = [
+        init_board(), [1, 0, 0, None, 0, None, 1, None, None],
+        [1, 0, 0, 1, 0, None, None, 0, 1]
+    ]
+    for b in boards:
+        bits = to_bitboard(b)
+        assert won_bits(bits, 0) == won(b, 0)
+        assert won_bits(bits, 1) == won(b, 1)
+        if moves(b) is None:
+            assert moves_bits(bits) is None
+        else:
+            assert list(map(from_bitboard, moves_bits(bits))) == list(moves(b))
+
+    b = init_board()
+    assert tree_size(prune(gametree_bits(to_bitboard(b)))) == tree_size(
+        prune(gametree(b)))
+    with monkeypatch.context() as m:
+        m.setattr(tic_tac_toe, "reduce_symmetry", True)
+        boards = [
+            init_board(), [None, None, None, None, 0, None, None, None, None],
+            [1, 0, None, None, 0, None, None, None, None]
+        ]
+        for b in boards:
+            assert list(map(from_bitboard,
+                            moves_bits(to_bitboard(b)))) == list(moves(b))
+        b = init_board()
+        assert tree_size(prune(gametree_bits(to_bitboard(b)))) == tree_size(
+            prune(gametree(b)))
+    for idx in range(0, num_boards, 97):
+        b = index_board(idx)
+        assert static_eval_0_bits(to_bitboard(b)) == static_eval_0(b)
+
+    b = init_board()
+    bit_labels = tree_labels(
+        maptree(static_eval_bits(0), prune(gametree_bits(to_bitboard(b)))))
+    labels = tree_labels(maptree(static_eval(0), prune(gametree(b))))
+    assert list(bit_labels) == list(labels)
+
+
+def test_bitboard_evaluate():
+    boards = [[1, 0, None, None, 0, None, None, None, None],
+              [0, 1, None, None, 0, None, None, None, 1],
+              [0, 1, None, None, 0, None, 0, None, 1]]
+
+    for b in boards:
+        player = who_plays(b)
+        assert evaluate0_bits(player)(b) == evaluate0(player)(b)
+        for (evaluate, evaluate_bits) in [(evaluate1, evaluate1_bits),
+                                          (evaluate2, evaluate2_bits)]:
+            expected = evaluate(player)(b)
+            best_move = evaluate_bits(player)(b)
+            assert best_move.board == expected.board
+            assert best_move.score == expected.score
+
+        best_move = evaluate2_bits(player, TranspositionTable())(b)
+        assert best_move.board == evaluate2(player)(b).board
+
+
+def test_book(tmp_path, monkeypatch):
+    path = str(tmp_path / "book.bin")
+    # the empty board, 3 positions after 1 move, 12 after 2 moves
+    assert build_book(path, ply=3, depth=3) == 1 + 3 + 12
+    # the gameplay options are not changed
+    assert tic_tac_toe.max_depth == max_depth
+
+    monkeypatch.setattr(tic_tac_toe, "max_depth", 3)
+    monkeypatch.setattr(tic_tac_toe, "book_path", path)
+    monkeypatch.setattr(tic_tac_toe, "book", None)
+
+    boards = [init_board()] + list(moves(init_board()))
+    boards = boards + [b for b in boards[1:] for b in moves(b)]
+    computers = {0: 'computer', 1: 'computer'}
+    for b in boards:
+        player = who_plays(b)
+        best = lookup_book(b, 3)
+        assert best.score == evaluate2(player)(b).score
+        assert sum(1 for (i, j) in zip(b, best.board) if i != j) == 1
+        assert best.board[[i for i in range(num_pos)
+                           if b[i] != best.board[i]][0]] == player
+        # the book is only used if it's asked for
+        assert computer_next_move(b, None, use_book=True) == best.board
+        assert player_next_move(b, computers, None,
+                                use_book=True) == best.board
+        assert computer_next_move(b, evaluate2) == evaluate2(player)(b).board
+        # and if it was searched to the same depth
+        assert lookup_book(b, 2) is None
+
+    assert lookup_book([0, 1, 0, None, None, None, None, None, None],
+                       3) is None
+
+    monkeypatch.setattr(tic_tac_toe, "max_depth", 2)
+    b = init_board()
+    assert computer_next_move(b, evaluate2,
+                              use_book=True) == evaluate2(0)(b).board
+
+
+def test_self_play():
+    players = (Player(evaluate2, 2, False), Player(evaluate1, 1, False))
+    report = self_play(4, players, workers=2)
+    assert len(report.games) == 4
+    assert sum(report.wins) + report.draws == 4
+    assert report.games_per_sec > 0
+    assert report.moves_per_sec > report.games_per_sec
+
+    for game_ in report.games:
+        assert game_.boards[0] == init_board()
+        assert len(game_.move_times) == len(game_.boards) - 1
+        for (b0, b1) in zip(game_.boards, game_.boards[1:]):
+            # one move at a time
+            assert sum(1 for (i, j) in zip(b0, b1) if i != j) == 1
+        b = game_.boards[-1]
+        if game_.winner is None:
+            assert None not in b and not won(b, 0) and not won(b, 1)
+        else:
+            assert won(b, game_.winner)
+
+    # the games can be replayed
+    game_ = play_game(players, 2)
+    assert game_.boards == report.games[2].boards
+    # the gameplay options are restored
+    assert tic_tac_toe.max_depth == max_depth
+    assert tic_tac_toe.shuffle_moves is False
@@ -1,15 +1,26 @@
-from typing import List, Iterator, Callable, Optional
+from typing import List, Iterator, Callable, Optional, Tuple, NamedTuple
 from random import shuffle
 from functools import reduce
+from array import array
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import mmap
+import random
+import struct
+import time
+import numpy as np
 
 from lazy_utils import Node
 import lazy_utils
 import game
-from game import State
+from game import State, TranspositionTable, SearchStats
 
 ### gameplay options
 use_player_token = True
 shuffle_moves = False
+reduce_symmetry = False
 max_depth = 5
 
 posinf = 100000
@@ -85,6 +96,10 @@ def moves(board: Board) -> Optional[Iterator[Board]]:
         if shuffle_moves:
             shuffle(candidate_moves)
 
+        if reduce_symmetry:
+            candidate_moves = distinct_moves(board, candidate_moves,
+                                             next_player)
+
         if len(candidate_moves) == 0:
             return None
         else:
@@ -148,7 +163,7 @@ def static_eval(player: int) -> Callable[[Board], int]:
     assert player in [0, 1]
 
     def static_eval_(board):
-        v = static_eval_0(board)
+        v = lookup_static_eval_0(board)
         if player == 0:
             return v
         else:
@@ -157,10 +172,114 @@ def static_eval(player: int) -> Callable[[Board], int]:
     return static_eval_
 
 
+num_boards = 3**num_pos
+# the digit of a cell in the base-3 index of a board
+cell_digit = {None: 0, 0: 1, 1: 2}
+
+# where to cache the table of static scores (None: don't cache)
+eval_table_path: Optional[str] = None
+eval_table: Optional[array] = None
+
+
+def board_index(board: Board) -> int:
+    """Read a board as a base-3 number"""
+    idx = 0
+    for cell in reversed(board):
+        idx = idx * 3 + cell_digit[cell]
+    return idx
+
+
+def index_board(idx: int) -> Board:
+    """The board of a base-3 number"""
+    board = init_board()
+    for i in range(num_pos):
+        (idx, digit) = divmod(idx, 3)
+        board[i] = [None, 0, 1][digit]
+    return board
+
+
+def build_eval_table() -> array:
+    """Scores of all boards for player 0"""
+    return array('i', (static_eval_0(index_board(idx))
+                       for idx in range(num_boards)))
+
+
+def get_eval_table() -> array:
+    """Return the table of static scores. Build or load it if necessary."""
+    global eval_table
+
+    if eval_table is None:
+        table = array('i')
+        if eval_table_path is not None and os.path.exists(eval_table_path):
+            with open(eval_table_path, 'rb') as f:
+                table.fromfile(f, num_boards)
+        else:
+            table = build_eval_table()
+            if eval_table_path is not None:
+                with open(eval_table_path, 'wb') as f:
+                    table.tofile(f)
+        eval_table = table
+
+    return eval_table
+
+
+def lookup_static_eval_0(board: Board) -> int:
+    """Same as static_eval_0, but look the score up in a table"""
+    return get_eval_table()[board_index(board)]
+
+
+def static_eval_0_batch(boards: List[Board]) -> np.ndarray:
+    """Static board values for player 0, for a list of boards"""
+    cells = np.array(boards, dtype=float)
+    lines = cells[:, line_idx]
+    n0 = (lines == 0).sum(axis=2)
+    n1 = (lines == 1).sum(axis=2)
+
+    # a line is good for a player if the other player has no piece on it
+    good0 = n1 == 0
+    good1 = n0 == 0
+    x2 = (good0 & (n0 == 2)).sum(axis=1)
+    x1 = (good0 & (n0 == 1)).sum(axis=1)
+    o2 = (good1 & (n1 == 2)).sum(axis=1)
+    o1 = (good1 & (n1 == 1)).sum(axis=1)
+    val = 3 * x2 + x1 - (3 * o2 + o1)
+
+    val = np.where((n1 == 3).any(axis=1), neginf, val)
+    val = np.where((n0 == 3).any(axis=1), posinf, val)
+    return val
+
+
+def static_eval_batch(player: int) -> Callable[[List[Board]], List[int]]:
+    """Static board values for player i, for a list of boards"""
+    assert player in [0, 1]
+
+    def static_eval_(boards):
+        v = static_eval_0_batch(boards)
+        if player == 0:
+            return v.tolist()
+        else:
+            return (-1 * v).tolist()
+
+    return static_eval_
+
+
+def static_eval_state_batch(i: int) -> Callable[[List[Board]], List[State]]:
+    """Static board states for player i, for a list of boards"""
+    score_func = static_eval_batch(i)
+
+    def static_eval_(boards):
+        return [State(b, s) for (b, s) in zip(boards, score_func(boards))]
+
+    return static_eval_
+
+
 # given a player, returns a tree evlauation function
-def evaluate0(player: int) -> Callable[[Board], int]:
+def evaluate0(player: int,
+              batch: bool = False,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], int]:
     """Evaluate tic-tac-toe tree for player i (version 1)"""
-    return game.evaluate0(gametree, static_eval(player), prune)
+    return game.evaluate0(gametree, static_eval(player), prune,
+                          static_eval_batch(player) if batch else None, stats)
 
 
 def static_eval_state(i: int) -> Callable[[Board], State]:
@@ -175,15 +294,397 @@ def static_eval_state(i: int) -> Callable[[Board], State]:
 
 
 # given a player, returns a tree evlauation function
-def evaluate1(player: int) -> Callable[[Board], State]:
+def evaluate1(player: int,
+              table: Optional[TranspositionTable] = None,
+              batch: bool = False,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
     """Evaluate tic-tac-toe tree for player i (version 1)"""
-    return game.evaluate1(gametree, static_eval_state(player), prune)
+    return game.evaluate1(gametree, static_eval_state(player), prune, table,
+                          static_eval_state_batch(player) if batch else None,
+                          stats)
 
 
 # given a player, returns a tree evlauation function
-def evaluate2(player: int) -> Callable[[Board], State]:
+def evaluate2(player: int,
+              table: Optional[TranspositionTable] = None,
+              batch: bool = False,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
     """Evaluate tic-tac-toe tree for player i (version 1)"""
-    return game.evaluate2(gametree, static_eval_state(player), prune)
+    return game.evaluate2(gametree, static_eval_state(player), prune, table,
+                          static_eval_state_batch(player) if batch else None,
+                          stats)
+
+
+# given a player, returns a tree evlauation function
+def evaluate3(player: int,
+              stats: Optional[SearchStats] = None) -> Callable[[Board], State]:
+    """Evaluate tic-tac-toe tree for player i (version 3)"""
+    return game.evaluate3(gametree, static_eval_state(player), prune, stats)
+
+
+def search_functions(player: int, depth: int) -> game.SearchFunctions:
+    """The search functions for player i, made in a worker process"""
+
+    def prune_(tree: Node) -> Node:
+        return lazy_utils.prune(depth, tree)
+
+    return (gametree, static_eval_state(player), prune_)
+
+
+def search_pool(player: int,
+                workers: Optional[int] = None,
+                start_method: Optional[str] = None) -> game.SearchPool:
+    """Worker processes for evaluate_parallel(player)"""
+    return game.SearchPool(search_functions, (player, max_depth), workers,
+                           start_method)
+
+
+def evaluate_parallel(
+        player: int,
+        workers: Optional[int] = None,
+        pool: Optional[game.SearchPool] = None,
+        start_method: Optional[str] = None) -> Callable[[Board], State]:
+    """Evaluate tic-tac-toe tree for player i, using several processes"""
+    if pool is not None:
+        return game.evaluate_parallel(gametree,
+                                      static_eval_state(player),
+                                      prune,
+                                      pool=pool)
+
+    def evaluate_(board: Board) -> State:
+        with search_pool(player, workers, start_method) as pool_:
+            return game.evaluate_parallel(gametree,
+                                          static_eval_state(player),
+                                          prune,
+                                          pool=pool_)(board)
+
+    return evaluate_
+
+
+def transform(board: Board, perm: List[int]) -> Board:
+    """Transform a board with a permutation of positions"""
+    return [board[i] for i in perm]
+
+
+def compose(p: List[int], q: List[int]) -> List[int]:
+    """The permutation of transforming with p, and then q"""
+    return [p[i] for i in q]
+
+
+rotation = [6, 3, 0, 7, 4, 1, 8, 5, 2]
+reflection = [2, 1, 0, 5, 4, 3, 8, 7, 6]
+rotations = [list(range(num_pos))]
+for _ in range(3):
+    rotations.append(compose(rotations[-1], rotation))
+symmetries = rotations + [compose(r, reflection) for r in rotations]
+
+
+def canonical_index(board: Board) -> int:
+    """The same for all boards that are symmetric to each other"""
+    return min(board_index(transform(board, perm)) for perm in symmetries)
+
+
+def distinct_moves(board: Board, candidate_moves: List[int],
+                   player: int) -> List[int]:
+    """Remove the moves that lead to boards symmetric to earlier ones"""
+    seen = set()
+    res = []
+    for i in candidate_moves:
+        k = canonical_index(make_move(board, i, player))
+        if k not in seen:
+            seen.add(k)
+            res.append(i)
+    return res
+
+
+def evaluate_iterative(
+        player: int,
+        time_limit: Optional[float] = 1.0,
+        node_limit: Optional[int] = None) -> Callable[[Board], State]:
+    """Evaluate tic-tac-toe tree for player i, within a time or node budget"""
+    search = game.evaluate_iterative(gametree, static_eval_state(player), None,
+                                     time_limit, node_limit)
+
+    def evaluate_(board: Board) -> State:
+        for best in search(board):
+            pass
+        return best
+
+    return evaluate_
+
+
+# BitBoard is a type alias for (positions of player 0, positions of player 1)
+BitBoard = Tuple[int, int]
+
+full_mask = (1 << num_pos) - 1
+line_masks = [sum(1 << i for i in idx) for idx in line_idx]
+
+# look-up tables, indexed by the positions of a player (or the empty positions)
+bit_count = [bin(bits).count('1') for bits in range(full_mask + 1)]
+has_line = [
+    any(bits & m == m for m in line_masks) for bits in range(full_mask + 1)
+]
+bit_positions = [[i for i in range(num_pos) if bits & (1 << i)]
+                 for bits in range(full_mask + 1)]
+
+
+def to_bitboard(board: Board) -> BitBoard:
+    """Convert a list board to a bitboard"""
+    bits0 = sum(1 << i for i in range(num_pos) if board[i] == 0)
+    bits1 = sum(1 << i for i in range(num_pos) if board[i] == 1)
+    return (bits0, bits1)
+
+
+def from_bitboard(bits: BitBoard) -> Board:
+    """Convert a bitboard to a list board"""
+    board = init_board()
+    for player in [0, 1]:
+        for i in bit_positions[bits[player]]:
+            board[i] = player
+    return board
+
+
+def who_plays_bits(bits: BitBoard) -> int:
+    """Which player is playing the next move?"""
+    return bit_count[bits[0]] - bit_count[bits[1]]
+
+
+def won_bits(bits: BitBoard, player: int) -> bool:
+    """Has player won?"""
+    return has_line[bits[player]]
+
+
+def make_move_bits(bits: BitBoard, move: int, current_player: int) -> BitBoard:
+    """Apply a move (0-8) to a bitboard for a player.
+    Return a new bitboard.
+    """
+    if current_player == 0:
+        return (bits[0] | (1 << move), bits[1])
+    else:
+        return (bits[0], bits[1] | (1 << move))
+
+
+symmetry_bits = [[
+    sum(1 << j for j in range(num_pos) if bits & (1 << perm[j]))
+    for bits in range(full_mask + 1)
+] for perm in symmetries]
+
+
+def canonical_bits(bits: BitBoard) -> BitBoard:
+    """The same for all bitboards that are symmetric to each other"""
+    return min((t[bits[0]], t[bits[1]]) for t in symmetry_bits)
+
+
+def distinct_moves_bits(bits: BitBoard, candidate_moves: List[int],
+                        player: int) -> List[int]:
+    """Remove the moves that lead to bitboards symmetric to earlier ones"""
+    seen = set()
+    res = []
+    for i in candidate_moves:
+        k = canonical_bits(make_move_bits(bits, i, player))
+        if k not in seen:
+            seen.add(k)
+            res.append(i)
+    return res
+
+
+def moves_bits(bits: BitBoard) -> Optional[Iterator[BitBoard]]:
+    """Returns an iterator of bitboards for all legal next moves."""
+    next_player = bit_count[bits[0]] - bit_count[bits[1]]
+
+    if has_line[bits[1 - next_player]]:
+        # There is no legal move if the game is already won
+        return None
+
+    candidate_moves = bit_positions[full_mask & ~(bits[0] | bits[1])]
+
+    if shuffle_moves:
+        candidate_moves = candidate_moves.copy()
+        shuffle(candidate_moves)
+
+    if reduce_symmetry:
+        candidate_moves = distinct_moves_bits(bits, candidate_moves,
+                                              next_player)
+
+    if len(candidate_moves) == 0:
+        return None
+
+    return map(lambda i: make_move_bits(bits, i, next_player), candidate_moves)
+
+
+gametree_bits: Callable[[BitBoard], Node] = game.gametree(moves_bits)
+
+tri0 = [
+    sum(3**i for i in bit_positions[bits]) for bits in range(full_mask + 1)
+]
+tri1 = [2 * t for t in tri0]
+
+
+def static_eval_0_bits(bits: BitBoard) -> int:
+    """Static bitboard value for player 0"""
+    (bits0, bits1) = bits
+
+    if has_line[bits0]:
+        return posinf
+    elif has_line[bits1]:
+        return neginf
+
+    val = 0
+    for m in line_masks:
+        n0 = bit_count[bits0 & m]
+        n1 = bit_count[bits1 & m]
+        if n1 == 0:
+            val = val + (3 if n0 == 2 else n0)
+        elif n0 == 0:
+            val = val - (3 if n1 == 2 else n1)
+    return val
+
+
+def static_eval_bits(player: int) -> Callable[[BitBoard], int]:
+    """Static bitboard value for player i"""
+    assert player in [0, 1]
+
+    def static_eval_(bits):
+        v = get_eval_table()[tri0[bits[0]] + tri1[bits[1]]]
+        return v if player == 0 else -1 * v
+
+    return static_eval_
+
+
+def static_eval_state_bits(i: int) -> Callable[[BitBoard], State]:
+    """Static bitboard state for player i"""
+    score_func = static_eval_bits(i)
+
+    def static_eval_(bits):
+        return State(bits, score_func(bits))
+
+    return static_eval_
+
+
+def on_bitboard(
+        evaluate_: Callable[[BitBoard], State]) -> Callable[[Board], State]:
+    """Run a bitboard evaluation function on a list board"""
+
+    def evaluate_board_(board: Board) -> State:
+        s = evaluate_(to_bitboard(board))
+        return State(from_bitboard(s.board), s.score)
+
+    return evaluate_board_
+
+
+def evaluate0_bits(player: int) -> Callable[[Board], int]:
+    """Like evaluate0, but search with bitboards"""
+    evaluate_ = game.evaluate0(gametree_bits, static_eval_bits(player), prune)
+    return lambda board: evaluate_(to_bitboard(board))
+
+
+def evaluate1_bits(
+        player: int,
+        table: Optional[TranspositionTable] = None
+) -> Callable[[Board], State]:
+    """Like evaluate1, but search with bitboards"""
+    return on_bitboard(
+        game.evaluate1(gametree_bits, static_eval_state_bits(player), prune,
+                       table))
+
+
+def evaluate2_bits(
+        player: int,
+        table: Optional[TranspositionTable] = None
+) -> Callable[[Board], State]:
+    """Like evaluate2, but search with bitboards"""
+    return on_bitboard(
+        game.evaluate2(gametree_bits, static_eval_state_bits(player), prune,
+                       table))
+
+
+book_header = struct.Struct('<4sHH')
+book_record = struct.Struct('<Hbi')
+# the opening book is read from this file, if it's set
+book_path: Optional[str] = None
+book: Optional[mmap.mmap] = None
+
+
+def canonical_form(board: Board) -> Tuple[int, List[int]]:
+    """Return the index of the canonical board,
+    and the permutation that transforms board to it.
+    """
+    return min(
+        ((board_index(transform(board, perm)), perm) for perm in symmetries),
+        key=lambda x: x[0])
+
+
+def build_book(path: str,
+               ply: int = 4,
+               search: Callable[..., Callable[[Board],
+                                              State]] = game.evaluate2,
+               depth: int = max_depth) -> int:
+    """Search the positions of the first ply moves, and write an opening book.
+    Return the number of positions in the book.
+    """
+
+    def prune_(tree: Node) -> Node:
+        return lazy_utils.prune(depth, tree)
+
+    records = {}
+    level = {0: init_board()}
+    for _ in range(ply):
+        next_level = {}
+        for (idx, b) in level.items():
+            player = who_plays(b)
+            if won(b, 1 - player) or None not in b:
+                continue
+            best = search(gametree, static_eval_state(player), prune_)(b)
+            move = [i for i in range(num_pos) if b[i] != best.board[i]][0]
+            records[idx] = (move, best.score)
+
+            for i in range(num_pos):
+                if b[i] is None:
+                    (k, perm) = canonical_form(make_move(b, i, player))
+                    next_level[k] = index_board(k)
+        level = next_level
+
+    with open(path, 'wb') as f:
+        f.write(book_header.pack(b'TTTB', ply, depth))
+        for idx in sorted(records):
+            f.write(book_record.pack(idx, *records[idx]))
+    return len(records)
+
+
+def get_book() -> Optional[mmap.mmap]:
+    """Return the opening book, or None if there isn't one"""
+    global book
+
+    if book is None and book_path is not None and os.path.exists(book_path):
+        with open(book_path, 'rb') as f:
+            book = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        assert book_header.unpack_from(book)[0] == b'TTTB'
+
+    return book
+
+
+def lookup_book(board: Board, depth: int) -> Optional[State]:
+    """Return the best move in the opening book, or None if it's not there.
+    The book has to be searched to depth.
+    """
+    m = get_book()
+    if m is None or book_header.unpack_from(m)[2] != depth:
+        return None
+
+    (idx, perm) = canonical_form(board)
+    (lo, hi) = (0, (len(m) - book_header.size) // book_record.size)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        (k, move, score) = book_record.unpack_from(
+            m, book_header.size + mid * book_record.size)
+        if k < idx:
+            lo = mid + 1
+        elif k > idx:
+            hi = mid
+        else:
+            # the move on the canonical board is at perm[move] on this board
+            return State(make_move(board, perm[move], who_plays(board)), score)
+    return None
 
 
 def player_token(i: int) -> str:
@@ -253,40 +754,43 @@ def human_next_move(board: Board) -> Optional[Board]:
         return make_move(board, i, player)
 
 
-def computer_next_move(
-        board: Board, eval_func: Callable[[int],
-                                          Callable[[Board],
-                                                   State]]) -> Optional[Board]:
+def computer_next_move(board: Board,
+                       eval_func: Callable[[int], Callable[[Board], State]],
+                       use_book: bool = False) -> Optional[Board]:
+    if use_book:
+        best = lookup_book(board, max_depth)
+        if best is not None:
+            return best.board
+
     player = who_plays(board)
     computer_move_function = eval_func(player)
     # computer_move_function is a State
     return computer_move_function(board).board
 
 
+human_vs_computer = {0: 'human', 1: 'computer'}
+
+
 def player_next_move(board: Board,
-                     player_settings={
-                         0: 'human',
-                         1: 'computer'
-                     },
-                     eval_func=evaluate1) -> Optional[Board]:
+                     player_settings=human_vs_computer,
+                     eval_func=evaluate1,
+                     use_book: bool = False) -> Optional[Board]:
     player = who_plays(board)
     if player_settings[player] == 'human':
         return human_next_move(board)
     else:
-        return computer_next_move(board, eval_func)
+        return computer_next_move(board, eval_func, use_book)
 
 
-def play(
-        player_settings={
-            0: 'human',
-            1: 'computer'
-        },
-        eval_func=evaluate1) -> None:
+def play(player_settings=human_vs_computer,
+         eval_func=evaluate1,
+         use_book: bool = False) -> None:
     b = init_board()
 
     finished = False
     while not finished:
-        b = player_next_move(b, player_settings, eval_func)  # type:ignore
+        b = player_next_move(b, player_settings, eval_func,
+                             use_book)  # type:ignore
         player = (who_plays(b) + 1) % 2
         print()
         print(f"{player_token(player)} played:")
@@ -300,3 +804,73 @@ def play(
         elif len([i for i in range(num_pos) if b[i] is None]) == 0:
             print("Draw!")
             finished = True
+
+
+Player = NamedTuple('Player',
+                    [('eval_func', Callable[[int], Callable[[Board], State]]),
+                     ('depth', int), ('use_book', bool)])
+Game = NamedTuple('Game', [('boards', List[Board]), ('winner', Optional[int]),
+                           ('move_times', List[float])])
+SelfPlayReport = NamedTuple('SelfPlayReport', [('games', List[Game]),
+                                               ('wins', List[int]),
+                                               ('draws', int),
+                                               ('games_per_sec', float),
+                                               ('moves_per_sec', float),
+                                               ('mean_move_time', float)])
+
+
+def play_game(players: Tuple[Player, Player], seed: int) -> Game:
+    """Play a game between two computer players, without input or output"""
+    global max_depth, shuffle_moves
+    (max_depth0, shuffle_moves0) = (max_depth, shuffle_moves)
+    random.seed(seed)
+    shuffle_moves = True
+
+    b = init_board()
+    boards = [b]
+    move_times = []
+    winner = None
+    try:
+        while winner is None and None in b:
+            player = who_plays(b)
+            (eval_func, max_depth, use_book) = players[player]
+
+            t = time.perf_counter()
+            next_b = computer_next_move(b, eval_func, use_book)
+            move_times.append(time.perf_counter() - t)
+
+            assert next_b is not None
+            b = next_b
+            boards.append(b)
+            if won(b, player):
+                winner = player
+    finally:
+        (max_depth, shuffle_moves) = (max_depth0, shuffle_moves0)
+
+    return Game(boards, winner, move_times)
+
+
+def self_play(n: int,
+              players: Tuple[Player,
+                             Player] = (Player(evaluate2, max_depth, False),
+                                        Player(evaluate2, max_depth, False)),
+              workers: Optional[int] = None,
+              seed: int = 0,
+              start_method: Optional[str] = None) -> SelfPlayReport:
+    """Play n games between two computer players in parallel"""
+    t = time.perf_counter()
+    with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context(start_method)) as executor:
+        games = list(
+            executor.map(play_game, repeat(players, n), range(seed, seed + n)))
+    elapsed = time.perf_counter() - t
+
+    move_times = [m for g in games for m in g.move_times]
+    return SelfPlayReport(
+        games=games,
+        wins=[sum(1 for g in games if g.winner == i) for i in [0, 1]],
+        draws=sum(1 for g in games if g.winner is None),
+        games_per_sec=n / elapsed,
+        moves_per_sec=len(move_times) / elapsed,
+        mean_move_time=sum(move_times) / max(len(move_times), 1))